@@ -1,8 +1,87 @@
 import os
+import re
 import pandas as pd
 import numpy as np
 import config
 
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:
+    pa = pa_csv = None
+
+# ID-like columns (order numbers, phones, carrier/invoice IDs, SKUs) look numeric but must stay text,
+# otherwise type inference drops leading zeros. Both CSV engines read them as strings.
+TEXT_ID_COLUMNS = [
+    alias
+    for key in ('order_id', 'member_phone', 'carrier_id', 'invoice_id', 'tax_id', 'source_id', 'sku')
+    for alias in config.COLUMN_MAPPING.get(key, [])
+]
+
+# Patterns used on whole columns, compiled once
+CURRENCY_CHARS_TABLE = str.maketrans('', '', 'NT$,')
+NOODLE_RICE_RE = re.compile('麵|飯')
+COMBO_ITEM_RE = re.compile('Combo Item', re.IGNORECASE)
+DELIVERY_TYPE_RE = re.compile('foodomo|uber|panda|delivery|外送')
+TAKEOUT_TYPE_RE = re.compile('take|tago|外帶|自取')
+
+# SKU prefix -> index into SKU_CATEGORY_LABELS
+SKU_CATEGORY_LABELS = np.array(
+    ['A 湯麵', 'B 拌麵飯', 'C 小菜', 'D1 單點', 'D2 青菜', 'D 單點/青菜', 'E 湯', 'F 飲料', 'S 套餐', '其他'], dtype=object
+)
+SKU_PREFIX_CODES = {'A': 0, 'B': 1, 'C': 2, 'D1': 3, 'D2': 4, 'D': 5, 'E': 6, 'F': 7, 'S': 8}
+SKU_OTHER_CODE = 9
+
+# National holidays as sorted day numbers (days since 1970-01-01), for integer isin() against datetime64[D] values
+TW_HOLIDAY_DAYS = np.sort(pd.to_datetime(config.TW_HOLIDAYS).to_numpy(dtype='datetime64[D]').view(np.int64))
+
+# Normalised (stripped, lower-cased) statuses that drop a row: whole orders vs single items
+INVALID_ORDER_STATUSES = frozenset(['已取消', 'cancelled', 'void', 'delete', 'deleted', '已關閉', 'closed'])
+INVALID_ITEM_STATUSES = frozenset(['已取消', 'cancelled', 'void', '已退菜', '退菜', '已關閉', 'closed'])
+
+# Day_Type / Period / Order_Category labels by code; the columns are built as categoricals straight from int8 codes
+DAY_TYPE_LABELS = ['平日 (Weekday)', '假日 (Holiday)', 'Unknown']
+PERIOD_LABELS = ['中午 (Lunch)', '晚上 (Dinner)', 'Unknown']
+ORDER_CATEGORY_LABELS = ['內用 (Dine-in)', '外帶 (Takeout)', '外送 (Delivery)']
+
+# Streaming read granularity: PyArrow blocks (bytes) / C engine chunks (rows)
+CSV_BLOCK_BYTES = 16 << 20
+CSV_CHUNK_ROWS = 200_000
+
+# Lower-cased source header -> standard column name
+ALIAS_MAP = {
+    alias.lower(): std_col
+    for std_col, aliases in config.COLUMN_MAPPING.items()
+    for alias in aliases
+}
+
+def iter_raw_files(path):
+    """Yields DirEntry objects for raw export files (.csv/.json/.txt) under path, in os.walk's top-down order.
+
+    Hidden directories (any '/.' in the path) are pruned rather than walked and filtered, and
+    symlinked directories are not followed, matching os.walk's defaults.
+    """
+    if '/.' in path:
+        return
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError:
+        return
+    subdirs = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            if not entry.is_symlink():
+                subdirs.append(entry.path)
+        elif entry.name.endswith(('.csv', '.json', '.txt')):
+            yield entry
+    for subdir in subdirs:
+        yield from iter_raw_files(subdir)
+
 class UniversalLoader:
     def __init__(self):
         self.report_data = [] # Type 1: Transaction Record (undefined) - Master Revenue
@@ -30,12 +109,13 @@ class UniversalLoader:
         
         # Load tracked files
         self.processed_files = {}
-        if os.path.exists(self.meta_cache):
-            try:
-                with open(self.meta_cache, 'r', encoding='utf-8') as mf:
-                    self.processed_files = json.load(mf)
-            except Exception as e:
-                self.log(f"⚠️ Failed to load processed_files.json: {e}")
+        try:
+            with open(self.meta_cache, 'r', encoding='utf-8') as mf:
+                self.processed_files = json.load(mf)
+        except FileNotFoundError:
+            pass # First run: nothing tracked yet
+        except Exception as e:
+            self.log(f"⚠️ Failed to load processed_files.json: {e}")
 
         # Store latest run dates in this object for backward compatibility
         self.latest_dates = self.processed_files.get('_latest_dates', {
@@ -50,21 +130,17 @@ class UniversalLoader:
             if not os.path.exists(root_dir):
                 self.log(f"Skipping missing directory: {root_dir}")
                 continue
-            for current_root, dirs, files in os.walk(root_dir):
-                if '/.' in current_root: continue
-                for f in files:
-                    if not (f.endswith(".csv") or f.endswith(".json") or f.endswith(".txt")): continue
-                    full_path = os.path.join(current_root, f)
-                    
-                    try:
-                        mtime = os.path.getmtime(full_path)
-                    except OSError:
-                        continue
-                        
-                    # Incremental check: Only process if file is new or modified
-                    last_mtime = self.processed_files.get(full_path, 0)
-                    if mtime > last_mtime:
-                        raw_files_to_process.append((full_path, mtime))
+            for entry in iter_raw_files(root_dir):
+                # DirEntry.stat() follows symlinks like getmtime but reuses the scandir entry
+                try:
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue
+
+                # Incremental check: Only process if file is new or modified
+                last_mtime = self.processed_files.get(entry.path, 0)
+                if mtime > last_mtime:
+                    raw_files_to_process.append((entry.path, mtime))
 
         if not raw_files_to_process:
             self.log("⚡ [Incremental Hit] No new or modified files. Exiting early.")
@@ -118,72 +194,112 @@ class UniversalLoader:
                 self._process_json_file(file_path)
                 return
 
-            # Attempt 1: Standard Load with fallback for Big5/Windows encodings
-            try:
-                df = pd.read_csv(file_path, encoding='utf-8-sig')
-            except UnicodeDecodeError:
-                try:
-                    df = pd.read_csv(file_path, encoding='big5')
-                except UnicodeDecodeError:
-                    df = pd.read_csv(file_path, encoding='utf-8', errors='replace')
+            # 1. Classify from the header row alone: unknown files never pay for a full parse
+            header_row = 0
+            df = self._read_csv_any_encoding(self._read_csv_header, file_path)
             
             # Smart Header Detection
             if self._is_messy_header(df):
                 self.log(f"🔄 Detected messy header in {os.path.basename(file_path)}, retrying with header=1")
-                try:
-                    df = pd.read_csv(file_path, header=1, encoding='utf-8-sig') # Retry with correct encoding
-                except UnicodeDecodeError:
-                    df = pd.read_csv(file_path, header=1, encoding='big5')
+                header_row = 1
+                df = self._read_csv_any_encoding(self._read_csv_header, file_path, header=header_row)
             
-            # 1. Clean Column Names
+            raw_cols = list(df.columns)
             df.columns = df.columns.astype(str).str.strip()
-            
-            # 2. Apply Synonym Mapping
             df = self._map_columns(df)
             
-            # 3. Classify and Store
             # Strategy: Filename Priority -> Column Content Fallback
             filename = os.path.basename(file_path)
             file_type = self._classify_by_filename(filename)
+            classified_by = 'By Name'
             
-            if file_type == 'details':
-                df = self._clean_details(df)
-                self.details_data.append(df)
-                self.log(f"✅ Loaded DETAILS (Type 3 - By Name): {filename} ({len(df)} rows)")
-                
-            elif file_type == 'report':
-                df = self._clean_report(df)
-                self.report_data.append(df)
-                self.log(f"✅ Loaded REPORT (Type 1 - By Name): {filename} ({len(df)} rows)")
-                
-            elif file_type == 'invoice':
-                df = self._clean_invoice(df)
-                self.invoice_data.append(df)
-                self.log(f"✅ Loaded INVOICE (Type 2 - By Name): {filename} ({len(df)} rows)")
-                
-            else:
-                # Fallback to Content-Based Classification
+            if file_type is None:
+                classified_by = 'By Cols'
                 if self._is_details(df, filename): # Pass filename
-                    df = self._clean_details(df)
-                    self.details_data.append(df)
-                    self.log(f"✅ Loaded DETAILS (Type 3 - By Cols): {filename} ({len(df)} rows)")
-                    
+                    file_type = 'details'
                 elif self._is_report(df):
-                    df = self._clean_report(df)
-                    self.report_data.append(df)
-                    self.log(f"✅ Loaded REPORT (Type 1 - By Cols): {filename} ({len(df)} rows)")
-                    
+                    file_type = 'report'
                 elif self._is_invoice(df):
-                    df = self._clean_invoice(df)
-                    self.invoice_data.append(df)
-                    self.log(f"✅ Loaded INVOICE (Type 2 - By Cols): {filename} ({len(df)} rows)")
-                    
+                    file_type = 'invoice'
                 else:
                     self.log(f"⚠️ Skipped {filename}: Could not classify (Cols: {list(df.columns[:5])}...)")
+                    return
+            
+            # 2. Stream the columns COLUMN_MAPPING knows about, cleaning each chunk as it is parsed.
+            # Chunks go straight onto the type's list; _merge_data concatenates everything once.
+            clean, store, label = {
+                'details': (self._clean_details, self.details_data, 'DETAILS (Type 3'),
+                'report': (self._clean_report, self.report_data, 'REPORT (Type 1'),
+                'invoice': (self._clean_invoice, self.invoice_data, 'INVOICE (Type 2'),
+            }[file_type]
+            
+            def map_and_clean(chunk):
+                chunk.columns = chunk.columns.astype(str).str.strip()
+                return clean(self._map_columns(chunk))
+            
+            usecols = [c for c in raw_cols if str(c).strip().lower() in ALIAS_MAP]
+            chunks = self._read_csv_any_encoding(
+                self._read_csv_chunks, file_path, clean=map_and_clean, header=header_row, usecols=usecols or None
+            )
+            store.extend(chunks)
+            self.log(f"✅ Loaded {label} - {classified_by}): {filename} ({sum(len(c) for c in chunks)} rows)")
 
         except Exception as e:
             self.log(f"❌ Error reading {os.path.basename(file_path)}: {e}")
 
+    def _read_csv_any_encoding(self, read, file_path, **kwargs):
+        """Calls read() with UTF-8 (with BOM) then Big5 for Windows POS exports, replacing undecodable bytes as a last resort."""
+        for encoding in ('utf-8-sig', 'big5'):
+            try:
+                return read(file_path, encoding=encoding, **kwargs)
+            except UnicodeDecodeError:
+                continue
+        return read(file_path, encoding='utf-8', encoding_errors='replace', **kwargs)
+
+    def _read_csv_header(self, file_path, encoding, header=0, encoding_errors='strict'):
+        """Returns an empty DataFrame carrying only the file's column names."""
+        return pd.read_csv(file_path, header=header, nrows=0, encoding=encoding, encoding_errors=encoding_errors)
+
+    def _read_csv_chunks(self, file_path, encoding, clean, header=0, usecols=None, encoding_errors='strict'):
+        """Parses a CSV block by block and returns the list of clean(chunk) results.
+
+        Uses PyArrow's multi-threaded streaming reader when available and restarts on the pandas C engine
+        if a block fails (ragged rows, quoting quirks, a column changing type mid-file). Peak memory is one
+        raw block plus the cleaned output. UnicodeDecodeError is re-raised so the caller can retry with
+        another encoding.
+        """
+        if pa_csv is not None and encoding_errors == 'strict':
+            try:
+                reader = pa_csv.open_csv(
+                    file_path,
+                    read_options=pa_csv.ReadOptions(encoding=encoding, skip_rows=header, block_size=CSV_BLOCK_BYTES),
+                    convert_options=pa_csv.ConvertOptions(
+                        column_types={c: pa.string() for c in TEXT_ID_COLUMNS},
+                        include_columns=usecols,
+                        strings_can_be_null=True
+                    )
+                )
+                return [clean(self._arrow_to_pandas(batch)) for batch in reader]
+            except UnicodeDecodeError:
+                raise
+            except Exception:
+                pass # Partial results are discarded; the C engine re-reads the whole file
+
+        # No usecols here: with usecols the C engine stops checking field counts and would load ragged
+        # rows with shifted values. Every column is parsed so bad rows raise; the mapped ones are kept.
+        reader = pd.read_csv(file_path, header=header, encoding=encoding, encoding_errors=encoding_errors,
+                             dtype={c: str for c in TEXT_ID_COLUMNS}, chunksize=CSV_CHUNK_ROWS)
+        with reader:
+            return [clean(chunk[usecols] if usecols else chunk) for chunk in reader]
+
+    def _arrow_to_pandas(self, batch):
+        df = batch.to_pandas()
+        # Match the C engine: NaN (not None) for empty text cells, "Unnamed: N" for blank headers
+        text_cols = df.select_dtypes('object').columns
+        df[text_cols] = df[text_cols].fillna(np.nan)
+        df.columns = [c if c else f"Unnamed: {i}" for i, c in enumerate(df.columns)]
+        return df
+
     def _classify_by_filename(self, filename):
         """Returns 'report', 'details', 'invoice', or None based on naming convention."""
         fn_lower = filename.lower()
@@ -206,20 +322,17 @@ class UniversalLoader:
     def _map_columns(self, df):
         """Renames columns based on config.COLUMN_MAPPING."""
         new_cols = {}
-        alias_map = {}
-        for std_col, aliases in config.COLUMN_MAPPING.items():
-            for alias in aliases:
-                alias_map[alias.lower()] = std_col 
-        
         for col in df.columns:
             col_lower = col.lower()
-            if col_lower in alias_map:
-                new_cols[col] = alias_map[col_lower]
+            if col_lower in ALIAS_MAP:
+                new_cols[col] = ALIAS_MAP[col_lower]
         
         if new_cols:
             df.rename(columns=new_cols, inplace=True)
             # Remove duplicated columns (keep first) to prevent DataFrame string accessor errors
-            df = df.loc[:, ~df.columns.duplicated()].copy()
+            duplicated = df.columns.duplicated()
+            if duplicated.any():
+                df = df.loc[:, ~duplicated].copy()
         return df
 
     def _is_report(self, df):
@@ -249,24 +362,19 @@ class UniversalLoader:
     def _clean_report(self, df):
         """Standardizes types for Report data."""
         if 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date'], errors='coerce')
+            df['date'] = self._to_datetime(df['date'])
             
         if 'order_id' in df.columns:
-            df['order_id'] = df['order_id'].astype(str).str.strip()
-            df = df[df['order_id'] != 'nan']
+            # Pinned-dtype reads already deliver text; only cast when a source inferred numbers
+            order_ids = df['order_id'] if pd.api.types.is_string_dtype(df['order_id']) else df['order_id'].astype(str)
+            df['order_id'] = order_ids.str.strip()
+            df = df[df['order_id'].notna() & (df['order_id'] != 'nan')]
+            df['order_id'] = self._strip_order_id_zeros(df['order_id'])
             
             # Fix for POS daily reset order numbers (e.g. '111', '121' repeating every day in undefined report)
             # If date exists, and order_id is short/purely numeric, prefix it with the date to make it unique across days.
             if 'date' in df.columns:
-                def make_unique_id(row):
-                    oid = str(row['order_id'])
-                    dt = row['date']
-                    if pd.notna(dt) and oid.isdigit() and len(oid) <= 4:
-                        # Append hour and minute to prevent collision on same day (e.g., POS mid-day reset)
-                        return f"{dt.strftime('%Y%m%d')}-{oid}-{dt.strftime('%H%M')}"
-                    return oid
-                
-                df['order_id'] = df.apply(make_unique_id, axis=1)
+                df['order_id'] = self._make_unique_order_ids(df['order_id'], df['date'])
         
         if 'total_amount' in df.columns:
             df['total_amount'] = self._to_numeric(df['total_amount'])
@@ -277,35 +385,29 @@ class UniversalLoader:
         # Filter Status (Only Completed)
         if 'status' in df.columns:
             # Normalize status
-            df['status'] = df['status'].astype(str).str.strip().str.lower()
+            df['status'] = self._normalize_status(df['status'])
             
             # Relaxed Filter (v2.3.8): Exclude Cancelled instead of strict Include
             # This avoids dropping valid orders with statuses like 'Paid', 'Delivered', etc.
-            invalid_statuses = ['已取消', 'cancelled', 'void', 'delete', 'deleted', '已關閉', 'closed']
-            df = df[~df['status'].isin(invalid_statuses)]
+            df = df[~df['status'].isin(INVALID_ORDER_STATUSES)]
             
         return df
 
     def _clean_details(self, df):
         """Standardizes types for Details data."""
         if 'date' in df.columns:
-             df['date'] = pd.to_datetime(df['date'], errors='coerce')
+             df['date'] = self._to_datetime(df['date'])
 
         if 'order_id' in df.columns:
-            df['order_id'] = df['order_id'].astype(str).str.strip()
-            df = df[df['order_id'] != 'nan']
+            # Pinned-dtype reads already deliver text; only cast when a source inferred numbers
+            order_ids = df['order_id'] if pd.api.types.is_string_dtype(df['order_id']) else df['order_id'].astype(str)
+            df['order_id'] = order_ids.str.strip()
+            df = df[df['order_id'].notna() & (df['order_id'] != 'nan')]
+            df['order_id'] = self._strip_order_id_zeros(df['order_id'])
 
             # Match report composite key logic
             if 'date' in df.columns:
-                def make_unique_id(row):
-                    oid = str(row['order_id'])
-                    dt = row['date']
-                    if pd.notna(dt) and oid.isdigit() and len(oid) <= 4:
-                        # Append hour and minute to prevent collision on same day (e.g., POS mid-day reset)
-                        return f"{dt.strftime('%Y%m%d')}-{oid}-{dt.strftime('%H%M')}"
-                    return oid
-                
-                df['order_id'] = df.apply(make_unique_id, axis=1)
+                df['order_id'] = self._make_unique_order_ids(df['order_id'], df['date'])
 
         if 'item_total' in df.columns:
             df['item_total'] = self._to_numeric(df['item_total'])
@@ -318,19 +420,46 @@ class UniversalLoader:
         # Filter Item Status (Void/Cancelled items in valid orders)
         if 'status' in df.columns:
             # Normalize
-            df['status'] = df['status'].astype(str).str.strip().str.lower()
-            # Defines invalid statuses
-            invalid_statuses = ['已取消', 'cancelled', 'void', '已退菜', '退菜', '已關閉', 'closed']
+            df['status'] = self._normalize_status(df['status'])
             # Drop rows with invalid status
-            df = df[~df['status'].isin(invalid_statuses)]
+            df = df[~df['status'].isin(INVALID_ITEM_STATUSES)]
             
         return df
         
+    def _normalize_status(self, series):
+        """str -> strip -> lower; the string methods run once per distinct status (a handful) and are expanded back by code."""
+        codes, uniques = pd.factorize(series.astype(str))
+        normalized = pd.Index(uniques).str.strip().str.lower().to_numpy(dtype=object)
+        return pd.Series(normalized[codes], index=series.index)
+
+    def _strip_order_id_zeros(self, order_ids):
+        """Drops leading zeros from purely numeric order numbers ('0012' -> '12', '000' -> '0').
+
+        These columns used to be inferred as integers, so stored keys carry no leading zeros; stripping
+        them here keeps re-imported orders on the same key (and '00012' style numbers under the
+        4-digit prefix rule) now that the column is read as text.
+        """
+        digits = order_ids.str.isdigit()
+        if not digits.any():
+            return order_ids
+        return order_ids.where(~digits, order_ids[digits].str.lstrip('0').replace('', '0'))
+
+    def _make_unique_order_ids(self, order_ids, dates):
+        """Prefixes short numeric POS order numbers as YYYYMMDD-oid-HHMM, built with integer date arithmetic."""
+        mask = dates.notna() & order_ids.str.isdigit() & (order_ids.str.len() <= 4)
+        if not mask.any():
+            return order_ids
+        dt = dates[mask].dt
+        day = (dt.year * 10000 + dt.month * 100 + dt.day).astype(str)
+        # Append hour and minute to prevent collision on same day (e.g., POS mid-day reset)
+        hhmm = (dt.hour * 100 + dt.minute).astype(str).str.zfill(4)
+        return order_ids.where(~mask, day + '-' + order_ids[mask] + '-' + hhmm)
+
     def _clean_invoice(self, df):
         """Standardizes Invoice data."""
         if 'invoice_id' in df.columns:
             # Handle potential float/int IDs
-            df['invoice_id'] = df['invoice_id'].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
+            df['invoice_id'] = df['invoice_id'].astype(str).str.removesuffix('.0').str.strip()
             df = df[df['invoice_id'] != 'nan']
             
         if 'carrier_id' in df.columns:
@@ -338,10 +467,22 @@ class UniversalLoader:
             
         return df
 
+    def _to_datetime(self, series):
+        """Parses dates via the ISO8601 fast path; only values it rejects go through pandas' format inference."""
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return series
+        parsed = pd.to_datetime(series, format='ISO8601', errors='coerce')
+        retry = parsed.isna() & series.notna()
+        if retry.any():
+            parsed[retry] = pd.to_datetime(series[retry], errors='coerce')
+        return parsed
+
     def _to_numeric(self, series):
-        if series.dtype == 'object':
-            return pd.to_numeric(series.astype(str).str.replace(r'[NT\$,]', '', regex=True), errors='coerce').fillna(0)
-        return pd.to_numeric(series, errors='coerce').fillna(0)
+        """Currency text -> numbers. Columns that already parse as numbers skip the NT$/comma stripping."""
+        out = pd.to_numeric(series, errors='coerce')
+        if series.dtype == 'object' and (out.isna() & series.notna()).any():
+            out = pd.to_numeric(series.astype(str).str.translate(CURRENCY_CHARS_TABLE), errors='coerce')
+        return out.fillna(0)
 
     def _merge_data(self):
         """Merges 3 sources: Report (Main) + Invoice (Left Join) + Details (Linked)."""
@@ -360,7 +501,7 @@ class UniversalLoader:
         if self.invoice_data:
             invoice_lookup = pd.concat(self.invoice_data, ignore_index=True)
             if 'date' in invoice_lookup.columns:
-                invoice_lookup['date'] = pd.to_datetime(invoice_lookup['date'], errors='coerce')
+                invoice_lookup['date'] = self._to_datetime(invoice_lookup['date'])
                 max_dt = invoice_lookup['date'].max()
                 if pd.notna(max_dt):
                     self.latest_dates['invoice'] = max_dt.strftime('%Y-%m-%d')
@@ -382,7 +523,7 @@ class UniversalLoader:
                  
             # Compute max dates BEFORE deduplication
             if 'date' in final_report.columns:
-                temp_date = pd.to_datetime(final_report['date'], errors='coerce')
+                temp_date = self._to_datetime(final_report['date'])
                 final_report['_temp_date'] = temp_date
                 
                 j_df = final_report[final_report['data_source'] == 'json']
@@ -399,8 +540,9 @@ class UniversalLoader:
                  
             if 'order_id' in final_report.columns:
                 # Deduplicate Report Data: JSON has priority.
-                # Sort so 'data_source' == 'json' comes first
-                final_report.sort_values(by=['order_id', 'data_source'], ascending=[True, False], inplace=True)
+                # Hash lookups on the order_id key instead of sorting the whole frame.
+                is_json = final_report['data_source'] == 'json'
+                superseded = ~is_json & final_report['order_id'].isin(final_report.loc[is_json, 'order_id'])
                 
                 # --- PRESERVE CSV MEMBER DATA ---
                 # Before dropping the CSV row, we need to save the manual member info (phone, name).
@@ -411,13 +553,13 @@ class UniversalLoader:
                 
                 csv_members = pd.DataFrame()
                 if len(cols_to_preserve) > 1:
-                    csv_members = final_report[final_report['data_source'] == 'csv'][cols_to_preserve].copy()
+                    csv_members = final_report.loc[~is_json, cols_to_preserve]
                     # Drop empty/nan rows to create a clean lookup table
                     csv_members = csv_members.replace({'': pd.NA, 'nan': pd.NA}).dropna(subset=[c for c in cols_to_preserve if c != 'order_id'], how='all')
                     csv_members.drop_duplicates(subset=['order_id'], keep='first', inplace=True)
                 
                 # Perform Deduplication
-                final_report.drop_duplicates(subset=['order_id'], keep='first', inplace=True)
+                final_report = final_report[~superseded].drop_duplicates(subset=['order_id'], keep='first')
                 
                 # --- APPLY CSV MEMBER DATA ---
                 # Back-fill the surviving JSON row with the preserved CSV member data
@@ -443,7 +585,7 @@ class UniversalLoader:
                 # Avoid collision if report already has them (but usually report lacks carrier)
                 
                 # Rename collision
-                inv_subset = invoice_lookup[cols_to_merge].copy()
+                inv_subset = invoice_lookup[cols_to_merge]
                 
                 # Perform Merge
                 # Update: if Report ALREADY has carrier_id (from some other source), we might overwrite or fillna
@@ -470,10 +612,10 @@ class UniversalLoader:
                  
             # Extract Max Date before dropping CSV rows
             if 'date' in final_details.columns:
-                c_df = final_details[final_details['data_source'] == 'csv'].copy()
-                if not c_df.empty:
-                    c_df['temp_date'] = pd.to_datetime(c_df['date'], errors='coerce')
-                    m = c_df['temp_date'].max()
+                # Only the CSV rows' dates are parsed; no filtered copy of the whole frame is made
+                csv_dates = final_details.loc[final_details['data_source'] == 'csv', 'date']
+                if not csv_dates.empty:
+                    m = self._to_datetime(csv_dates).max()
                     if pd.notna(m):
                         self.latest_dates['csv_details'] = m.strftime('%Y-%m-%d')
             
@@ -482,15 +624,16 @@ class UniversalLoader:
             
             # Filter Details: Only keep details for valid Report Orders (Completed)
             if not final_report.empty and 'order_id' in final_report.columns and 'order_id' in final_details.columns:
-                valid_orders = set(final_report['order_id'].astype(str))
+                # order_id is text on every source (CSV reads pin it, JSON casts it), so match it directly
                 initial_count = len(final_details)
-                final_details = final_details[final_details['order_id'].astype(str).isin(valid_orders)]
+                final_details = final_details[final_details['order_id'].isin(final_report['order_id'])]
                 
                 # To deduplicate details effectively, we must deduplicate the "CSV" lines if JSON lines are present for the same order_id
                 # So we drop ALL CSV rows where order_id exists in JSON details.
-                json_order_ids = set(final_details[final_details['data_source'] == 'json']['order_id'].astype(str))
+                is_json = final_details['data_source'] == 'json'
+                json_order_ids = final_details.loc[is_json, 'order_id']
                 # Keep row if it's JSON, OR if it's CSV and the order is NOT in json_order_ids
-                mask = (final_details['data_source'] == 'json') | (~final_details['order_id'].astype(str).isin(json_order_ids))
+                mask = is_json | ~final_details['order_id'].isin(json_order_ids)
                 final_details = final_details[mask]
 
                 filtered_count = len(final_details)
@@ -525,18 +668,18 @@ class UniversalLoader:
                     continue
                     
                 # 1. REPORT DATA
-                order_id = order.get('short_code', '')
-                if not order_id:
-                    order_id = order.get('id', '')[-6:]
+                # Cast once here so merges can match CSV order IDs without re-casting whole columns
+                order_id = str(order.get('short_code', '') or order.get('id', '')[-6:])
                     
                 timestamp_ms = order.get('created_at')
-                date_str = pd.NaT
+                order_date = pd.NaT
                 if timestamp_ms:
                     dt = datetime.fromtimestamp(timestamp_ms / 1000.0, tz)
-                    date_str = dt.strftime('%Y-%m-%d %H:%M:%S')
+                    # Naive Taipei wall time to the second, kept as a datetime so it is never re-parsed from text
+                    order_date = dt.replace(tzinfo=None, microsecond=0)
                     
                     # Apply composite logic to match CSV: YYYYMMDD-oid-HHMM
-                    if str(order_id).isdigit() and len(str(order_id)) <= 4:
+                    if order_id.isdigit() and len(order_id) <= 4:
                         order_id = f"{dt.strftime('%Y%m%d')}-{order_id}-{dt.strftime('%H%M')}"
 
                 total_price = order.get('total_price', 0)
@@ -568,7 +711,7 @@ class UniversalLoader:
                 
                 report_row = {
                     'order_id': order_id,
-                    'date': date_str,
+                    'date': order_date,
                     'total_amount': total_price,
                     'status': status,
                     'order_type': o_type,
@@ -598,7 +741,7 @@ class UniversalLoader:
                     
                     details_row = {
                         'order_id': order_id,
-                        'date': date_str,
+                        'date': order_date,
                         'status': status,
                         'item_name': item_name,
                         'sku': sku,
@@ -622,7 +765,7 @@ class UniversalLoader:
                         
                         b_details_row = {
                             'order_id': order_id,
-                            'date': date_str,
+                            'date': order_date,
                             'status': status,
                             'item_name': b_name,
                             'sku': b_sku,
@@ -657,10 +800,16 @@ class UniversalLoader:
             # Parse Date & Time
             # Assuming 'date' is already datetime from _clean_report, but let's ensure
             if 'date' in df_report.columns:
-                df_report['Date_Parsed'] = pd.to_datetime(df_report['date'], errors='coerce')
+                df_report['Date_Parsed'] = self._to_datetime(df_report['date'])
                 
                 # Day Type
-                df_report['Day_Type'] = df_report['Date_Parsed'].apply(self._get_day_type)
+                dates = df_report['Date_Parsed']
+                # Whole-day integers: 1970-01-01 was a Thursday, so (day + 3) % 7 is Monday=0 .. Sunday=6
+                days = dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').view(np.int64)
+                is_holiday = ((days + 3) % 7 >= 5) | np.isin(days, TW_HOLIDAY_DAYS)
+                df_report['Day_Type'] = pd.Categorical.from_codes(
+                    np.where(dates.isna(), 2, is_holiday).astype(np.int8), categories=DAY_TYPE_LABELS
+                )
                 
                 # Period (Lunch/Dinner)
                 # If date has time component? 
@@ -674,7 +823,11 @@ class UniversalLoader:
                 # That would overwrite.
                 # Quick fix: The source usually has a combined datetime or separate.
                 # For now, simplistic period check from Date_Parsed if it has time.
-                df_report['Period'] = df_report['Date_Parsed'].apply(self._get_period)
+                # Midnight usually means no time info
+                no_time = dates.isna() | ((dates.dt.hour == 0) & (dates.dt.minute == 0))
+                df_report['Period'] = pd.Categorical.from_codes(
+                    np.where(no_time, 2, dates.dt.hour >= 16).astype(np.int8), categories=PERIOD_LABELS
+                )
 
             # Member Identification Logic (Name/Phone OR Carrier)
             # Create a 'Member_ID' column
@@ -688,35 +841,40 @@ class UniversalLoader:
             # 1. Identify Highly-Shared Phones (Platform Phones)
             # Clean phones temporarily for counting
             temp_phones = df_report['member_phone'].astype(str).str.strip().str.replace(' ', '')
-            valid_mask = (temp_phones.str.len() >= 6) & (~temp_phones.str.contains(r'\*')) & (temp_phones != 'nan')
+            valid_mask = (temp_phones.str.len() >= 6) & (~temp_phones.str.contains('*', regex=False)) & (temp_phones != 'nan')
             
             # Count distinct customer names per phone
-            name_counts = df_report[valid_mask].groupby(temp_phones[valid_mask])['customer_name'].nunique()
+            name_counts = df_report[valid_mask].groupby(temp_phones[valid_mask], sort=False)['customer_name'].nunique()
             shared_phones_auto = set(name_counts[name_counts >= 10].index)
             
             # Add known hardcoded platforms
             known_platforms = {'55941277', '77519126'}
             platform_phones = shared_phones_auto.union(known_platforms)
+            known_platform_re = re.compile('|'.join(map(re.escape, sorted(known_platforms))))
+            has_known_platform = temp_phones.str.contains(known_platform_re)
             
             # --- Carrier ID to Phone Mapping (Strategy B) ---
             # 1. Extract valid, non-platform, non-hidden phones with carrier IDs
             valid_phone_mask = (
                 (temp_phones.str.len() > 6) & 
-                (~temp_phones.str.contains(r'\*')) & 
+                (~temp_phones.str.contains('*', regex=False)) & 
                 (temp_phones != 'nan') &
                 (~temp_phones.isin(platform_phones)) &
-                (~temp_phones.apply(lambda p: any(k in p for k in known_platforms)))
+                (~has_known_platform)
             )
             
             valid_carrier_mask = (
                 df_report['carrier_id'].astype(str).str.len() > 4
             ) & (df_report['carrier_id'].astype(str) != 'nan')
             
-            carrier_df = df_report[valid_phone_mask & valid_carrier_mask].copy()
+            carrier_mask = valid_phone_mask & valid_carrier_mask
             
-            if not carrier_df.empty:
+            if carrier_mask.any():
+                # Only the columns the ranking reads; the day key is added with assign, so no defensive copy
+                carrier_df = df_report.loc[carrier_mask, ['carrier_id', 'member_phone', 'customer_name', 'Date_Parsed', 'total_amount']]
+                
                 # 2. Calculate Frequency (distinct dates), Recency (max date), Monetary (sum amount)
-                carrier_df['date_only'] = carrier_df['Date_Parsed'].dt.date
+                carrier_df = carrier_df.assign(date_only=carrier_df['Date_Parsed'].dt.normalize())
                 carrier_stats = carrier_df.groupby(['carrier_id', 'member_phone', 'customer_name']).agg(
                     Frequency=('date_only', 'nunique'),
                     Recency=('Date_Parsed', 'max'),
@@ -732,49 +890,52 @@ class UniversalLoader:
                 # Drop duplicates to keep the #1 Ranked phone per carrier
                 best_carriers = carrier_stats.drop_duplicates(subset=['carrier_id'], keep='first')
                 
-                # 3. Create mapping dictionaries
-                carrier_to_phone = dict(zip(best_carriers['carrier_id'], best_carriers['member_phone']))
-                carrier_to_name = dict(zip(best_carriers['carrier_id'], best_carriers['customer_name']))
+                # 3. Create mapping Series (carrier_id index, looked up through a hash join)
+                best_carriers = best_carriers.set_index('carrier_id')
+                carrier_to_phone = best_carriers['member_phone']
+                carrier_to_name = best_carriers['customer_name']
                 
                 # 4. Apply mapping to rows with carrier but NO valid phone
                 # Identify rows needing backfill (missing, empty, nan, or hidden)
                 needs_backfill = (
                     (~valid_phone_mask) & valid_carrier_mask & 
                     (~temp_phones.isin(platform_phones)) & 
-                    (~temp_phones.apply(lambda p: any(k in p for k in known_platforms)))
+                    (~has_known_platform)
                 )
                 
-                # Map values
-                mapped_phones = df_report.loc[needs_backfill, 'carrier_id'].map(carrier_to_phone)
-                mapped_names = df_report.loc[needs_backfill, 'carrier_id'].map(carrier_to_name)
+                # Map values (NaN outside the backfill rows)
+                backfill_carriers = df_report['carrier_id'].where(needs_backfill)
+                mapped_phones = backfill_carriers.map(carrier_to_phone)
+                mapped_names = backfill_carriers.map(carrier_to_name)
                 
                 # Replace explicitly, ignore existing invalid values if map exists
-                df_report.loc[needs_backfill & mapped_phones.notna(), 'member_phone'] = mapped_phones
-                df_report.loc[needs_backfill & mapped_names.notna(), 'customer_name'] = mapped_names
+                df_report['member_phone'] = df_report['member_phone'].mask(mapped_phones.notna(), mapped_phones)
+                df_report['customer_name'] = df_report['customer_name'].mask(mapped_names.notna(), mapped_names)
                 
             # --- End Carrier Mapping ---
             
-            def get_member_id(row):
-                p = str(row.get('member_phone', '')).strip().replace(' ', '')
-                c = str(row.get('carrier_id', '')).strip()
-                n = str(row.get('customer_name', '')).strip()
-                
-                # Hidden Phone Exception (e.g., ******)
-                if '*' in p:
-                    p = ''
-                    
-                # Platform Phone Exception (e.g., UberEats)
-                is_platform = (p in platform_phones) or any(k in p for k in known_platforms)
-                
-                if is_platform:
-                    if len(n) > 0 and n != 'nan': return f"UE_{n}"
-                    p = ''
-                
-                if len(p) > 6 and p != 'nan': return f"CRM_{p}" # Valid Phone
-                if len(c) >= 7 and c != 'nan' and c.startswith('/'): return f"Carrier_{c}" # Valid Carrier
-                return '非會員' # Non-member
-                
-            df_report['Member_ID'] = df_report.apply(get_member_id, axis=1)
+            # Member ID, column-wise: platform name > valid phone > valid carrier > non-member
+            p = df_report['member_phone'].astype(str).str.strip().str.replace(' ', '', regex=False)
+            c = df_report['carrier_id'].astype(str).str.strip()
+            n = df_report['customer_name'].astype(str).str.strip()
+            
+            # Hidden Phone Exception (e.g., ******)
+            p = p.mask(p.str.contains('*', regex=False), '')
+            
+            # Platform Phone Exception (e.g., UberEats)
+            is_platform = p.isin(platform_phones) | p.str.contains(known_platform_re)
+            has_name = (n.str.len() > 0) & (n != 'nan')
+            p = p.mask(is_platform, '')
+            
+            df_report['Member_ID'] = np.select(
+                [
+                    is_platform & has_name,
+                    (p.str.len() > 6) & (p != 'nan'), # Valid Phone
+                    (c.str.len() >= 7) & (c != 'nan') & c.str.startswith('/'), # Valid Carrier
+                ],
+                ['UE_' + n, 'CRM_' + p, 'Carrier_' + c],
+                default='非會員' # Non-member
+            )
             
             # Order Category Logic (Dine-in / Takeout / Delivery)
             if 'order_type' not in df_report.columns:
@@ -782,27 +943,24 @@ class UniversalLoader:
             if 'payment_method' not in df_report.columns:
                 df_report['payment_method'] = ''
                 
-            def get_order_category(row):
-                otype = str(row.get('order_type', '')).lower()
-                pmethod = str(row.get('payment_method', '')).lower()
-                
-                # Check Platform / Payment Method first
-                if 'foodomo' in pmethod or 'foodomo' in otype:
-                    return '外送 (Delivery)'
-                    
-                if 'uber' in otype or 'panda' in otype or 'delivery' in otype or '外送' in otype: 
-                    return '外送 (Delivery)'
-                if 'take' in otype or 'tago' in otype or '外帶' in otype or '自取' in otype: 
-                    return '外帶 (Takeout)'
-                return '內用 (Dine-in)' # Default
-                
-            df_report['Order_Category'] = df_report.apply(get_order_category, axis=1)
+            otype = df_report['order_type'].astype(str).str.lower()
+            pmethod = df_report['payment_method'].astype(str).str.lower()
+            # Platform / Payment Method first, then the order type keywords
+            order_category_codes = np.select(
+                [
+                    pmethod.str.contains('foodomo', regex=False, na=False) | otype.str.contains(DELIVERY_TYPE_RE, na=False),
+                    otype.str.contains(TAKEOUT_TYPE_RE, na=False),
+                ],
+                [2, 1],
+                default=0 # Default: Dine-in
+            ).astype(np.int8)
+            df_report['Order_Category'] = pd.Categorical.from_codes(order_category_codes, categories=ORDER_CATEGORY_LABELS)
 
         # --- 2. Details Enrichment ---
         if not df_details.empty:
             # Parse Date
             if 'date' in df_details.columns:
-                 df_details['Date_Parsed'] = pd.to_datetime(df_details['date'], errors='coerce')
+                 df_details['Date_Parsed'] = self._to_datetime(df_details['date'])
 
             # Main Dish / Modifier Logic
             # User Definition (Strict):
@@ -810,14 +968,12 @@ class UniversalLoader:
             # 2. Exclude rows where Modifier Name (options) is NOT Empty
             
             if 'options' in df_details.columns:
+                # Blank = NaN or whitespace only; scanned once for both the modifier flag and the main dish filter
+                options_blank = df_details['options'].isna() | (df_details['options'].astype(str).str.strip() == '')
                 # If options has content, it's a modifier row (for CSV).
                 # For JSON, options are nested within the actual items, so having options doesn't make it a modifier row.
                 mask_csv = (df_details.get('data_source', '') != 'json')
-                df_details['Is_Modifier'] = (
-                    mask_csv &
-                    df_details['options'].notna() & 
-                    (df_details['options'].astype(str).str.strip() != '')
-                )
+                df_details['Is_Modifier'] = mask_csv & ~options_blank
             else:
                 # Fallback
                 if 'unit_price' in df_details.columns:
@@ -834,51 +990,33 @@ class UniversalLoader:
                 sku_series = df_details['sku'].fillna('').astype(str).str.upper().str.strip()
                 
                 # Category Assignment
-                def get_sku_category(sku):
-                    if sku.startswith('A'): return 'A 湯麵'
-                    if sku.startswith('B'): return 'B 拌麵飯'
-                    if sku.startswith('C'): return 'C 小菜'
-                    if sku.startswith('D1'): return 'D1 單點'
-                    if sku.startswith('D2'): return 'D2 青菜'
-                    if sku.startswith('D'): return 'D 單點/青菜'
-                    if sku.startswith('E'): return 'E 湯'
-                    if sku.startswith('F'): return 'F 飲料'
-                    if sku.startswith('S'): return 'S 套餐'
-                    return '其他'
-                    
-                df_details['category'] = sku_series.apply(get_sku_category)
+                df_details['category'] = self._sku_category(sku_series)
                 
                 # Is_Main_Dish Definition
                 # Rule: SKU starts with A or B (Combos 'S' are not main dishes themselves to avoid double counting)
                 cond_sku_match = sku_series.str.startswith(('A', 'B'))
                 
-                # Fallback if no SKU (legacy data support): contains 麵 or 飯 but is not a combo item
-                name_series = df_details['item_name'].fillna('').astype(str)
-                cond_name_match = name_series.str.contains('麵|飯', regex=True, na=False)
-                
-                combo_indicators = []
-                if 'item_type' in df_details.columns:
-                    combo_indicators.append(df_details['item_type'])
-                if 'order_type' in df_details.columns:
-                    combo_indicators.append(df_details['order_type'])
+                # Fallback if no SKU (legacy data support): contains 麵 or 飯 but is not a combo item.
+                # Only SKU-less rows reach the name/type regexes; SKU rows are settled by prefix above.
+                no_sku = (sku_series == '').to_numpy()
+                cond_no_sku_fallback = np.zeros(len(df_details), dtype=bool)
+                if no_sku.any():
+                    legacy = df_details[no_sku]
+                    name_series = legacy['item_name'].fillna('').astype(str)
+                    cond_name_match = name_series.str.contains(NOODLE_RICE_RE, na=False)
                     
-                if combo_indicators:
-                    combined_type = pd.concat(combo_indicators, axis=1).fillna('').astype(str)
-                    is_combo = combined_type.apply(lambda row: row.str.contains('Combo Item', case=False).any(), axis=1)
-                    mask_not_combo = ~is_combo
-                else:
-                    mask_not_combo = True
-                
-                cond_no_sku_fallback = (sku_series == '') & cond_name_match & mask_not_combo
+                    # Either type column marking a combo item excludes the row (OR'd in place, no concat)
+                    legacy_main = cond_name_match
+                    for col in ('item_type', 'order_type'):
+                        if col in legacy.columns:
+                            legacy_main = legacy_main & ~legacy[col].fillna('').astype(str).str.contains(COMBO_ITEM_RE)
+                    
+                    cond_no_sku_fallback[no_sku] = legacy_main.to_numpy()
                 
                 # Must NOT be a Modifier
                 # For CSV, modifier rows often have 'options' filled. For JSON, 'options' are just attributes of the main dish.
                 mask_json = (df_details.get('data_source', '') == 'json')
-                mask_no_mod = (
-                    mask_json |
-                    df_details['options'].isna() | 
-                    (df_details['options'].astype(str).str.strip() == '')
-                )
+                mask_no_mod = mask_json | options_blank
                 
                 # Global Filter
                 df_details['Is_Main_Dish'] = (cond_sku_match | cond_no_sku_fallback) & mask_no_mod
@@ -887,45 +1025,44 @@ class UniversalLoader:
             # Update people_count in df_report based on actual Main Dishes in df_details
             # Especially crucial for JSON orders and Delivery/Takeout where party_size is hardcoded to 1
             if 'Is_Main_Dish' in df_details.columns and 'order_id' in df_report.columns:
-                # Count main dishes per order
-                main_dish_counts = df_details[df_details['Is_Main_Dish']].groupby('order_id')['qty'].sum().reset_index()
+                # Count main dishes per order (kept as main_dish_count so the pipeline does not recount)
+                main_dish_counts = df_details.loc[df_details['Is_Main_Dish'], ['order_id', 'qty']].groupby('order_id', sort=False)['qty'].sum().reset_index()
                 main_dish_counts = main_dish_counts.rename(columns={'qty': 'calculated_people'})
                 
                 # Merge into report
                 df_report = df_report.merge(main_dish_counts, on='order_id', how='left')
                 df_report['calculated_people'] = df_report['calculated_people'].fillna(0)
+                df_report['main_dish_count'] = df_report['calculated_people'].astype(int)
                 
                 # Logic: If calculated people > current people_count OR it's a JSON order, use calculated
                 # (except if calculated is 0, keep at least 1 if original was >= 1)
-                def fix_people_count(row):
-                    orig = pd.to_numeric(row.get('people_count', 0), errors='coerce')
-                    if pd.isna(orig): orig = 0
-                    calc = row.get('calculated_people', 0)
-                    
-                    # For JSON or Takeout/Delivery, mostly trust the main dish count
-                    if row.get('data_source') == 'json' or row.get('order_type') in ['外送', '外帶', '自取']:
-                        return max(calc, 1) if calc > 0 else max(orig, 1)
-                    
-                    # For normal Dine-in CSVs, if calculated > orig, trust calculated
-                    return max(orig, calc)
-                    
-                df_report['people_count'] = df_report.apply(fix_people_count, axis=1)
+                if 'people_count' in df_report.columns:
+                    orig = pd.to_numeric(df_report['people_count'], errors='coerce').fillna(0)
+                else:
+                    orig = 0
+                calc = df_report['calculated_people']
+                order_type = df_report['order_type'] if 'order_type' in df_report.columns else pd.Series('', index=df_report.index)
+                
+                # For JSON or Takeout/Delivery, mostly trust the main dish count;
+                # for normal Dine-in CSVs, if calculated > orig, trust calculated
+                trust_calc = (df_report.get('data_source', '') == 'json') | order_type.isin(['外送', '外帶', '自取'])
+                df_report['people_count'] = np.where(
+                    trust_calc,
+                    np.where(calc > 0, np.maximum(calc, 1), np.maximum(orig, 1)),
+                    np.maximum(orig, calc)
+                )
                 df_report.drop(columns=['calculated_people'], inplace=True)
 
         return df_report, df_details
 
-    def _get_day_type(self, dt):
-        if pd.isnull(dt): return 'Unknown'
-        d_str = dt.strftime('%Y-%m-%d')
-        if d_str in config.TW_HOLIDAYS_SET: return '假日 (Holiday)' 
-        if dt.weekday() >= 5: return '假日 (Holiday)' 
-        return '平日 (Weekday)'
-
-    def _get_period(self, dt):
-        if pd.isnull(dt): return 'Unknown'
-        if dt.hour == 0 and dt.minute == 0: return 'Unknown' # Midnight usually means no time info
-        
-        return '中午 (Lunch)' if dt.hour < 16 else '晚上 (Dinner)'
+    def _sku_category(self, sku_series):
+        """Maps upper-cased SKUs to categories by prefix, doing the string work once per distinct SKU."""
+        codes, uniques = pd.factorize(sku_series)
+        uniques = pd.Series(uniques)
+        # Two-character prefixes (D1/D2) win over their one-character parent (D)
+        prefix_codes = uniques.str[:2].map(SKU_PREFIX_CODES).fillna(uniques.str[:1].map(SKU_PREFIX_CODES))
+        prefix_codes = prefix_codes.fillna(SKU_OTHER_CODE).to_numpy(np.int8)
+        return pd.Categorical.from_codes(prefix_codes[codes], categories=SKU_CATEGORY_LABELS)
 
 
 if __name__ == "__main__":
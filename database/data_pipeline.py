@@ -1,5 +1,6 @@
 import os
 import sys
+from itertools import repeat
 import psycopg2
 from data_loader import UniversalLoader
 from config import DB_HOST, DB_NAME, DB_USER, DB_PASSWORD
@@ -49,15 +50,25 @@ def setup_database():
     conn.close()
     print("Database schema created successfully.")
 
+def build_records(df, columns, defaults):
+    """Zips columns into insert tuples (first column, resolved date, rest), skipping rows without a date.
+
+    Date_Parsed falls back to the raw 'date' column; columns the loader did not produce take their
+    default from `defaults` (None otherwise).
+    """
+    date_vals = df['Date_Parsed'].where(df['Date_Parsed'].notna(), df.get('date'))
+    keep = date_vals.notna()
+    df, date_vals = df[keep], date_vals[keep]
+    values = [df[col] if col in df.columns else repeat(defaults.get(col)) for col in columns]
+    values.insert(1, date_vals)
+    return list(zip(*values))
+
 def transform_and_load_orders(df_report, df_details):
     print(f"Loading {len(df_report)} orders into the database...")
     
-    # 預處理資料以符合資料表 Schema
-    records_to_insert = []
-    
-    # 計算主餐數量（防呆：沒有 details 時跳過）
-    if df_details is not None and not df_details.empty and 'Is_Main_Dish' in df_details.columns:
-        main_dish_counts = df_details[df_details['Is_Main_Dish']].groupby('order_id')['qty'].sum().reset_index()
+    # 計算主餐數量（UniversalLoader.enrich_data 已算好時直接沿用；防呆：沒有 details 時跳過）
+    if 'main_dish_count' not in df_report.columns and df_details is not None and not df_details.empty and 'Is_Main_Dish' in df_details.columns:
+        main_dish_counts = df_details.loc[df_details['Is_Main_Dish'], ['order_id', 'qty']].groupby('order_id', sort=False)['qty'].sum().reset_index()
         main_dish_counts = main_dish_counts.rename(columns={'qty': 'main_dish_count'})
         df_report = df_report.merge(main_dish_counts, on='order_id', how='left')
 
@@ -68,32 +79,12 @@ def transform_and_load_orders(df_report, df_details):
     # 將 NaN 轉為 None
     df_report = df_report.replace({float('nan'): None, '': None})
 
-    for _, row in df_report.iterrows():
-        # 處理日期對象
-        date_val = row['Date_Parsed'] if pd.notna(row['Date_Parsed']) else row['date']
-        if pd.isna(date_val): 
-            continue
-            
-        record = (
-            row.get('order_id'),
-            date_val,
-            row.get('total_amount', 0),
-            row.get('status'),
-            row.get('order_type'),
-            row.get('people_count', 1),
-            row.get('payment_method'),
-            row.get('member_phone'),
-            row.get('customer_name'),
-            row.get('invoice_id'),
-            row.get('carrier_id'),
-            row.get('data_source', 'csv'),
-            row.get('Day_Type'),
-            row.get('Period'),
-            row.get('Member_ID'),
-            row.get('Order_Category'),
-            row.get('main_dish_count', 0)
-        )
-        records_to_insert.append(record)
+    # 逐欄組出寫入資料（缺少日期的列略過）
+    records_to_insert = build_records(df_report, [
+        'order_id', 'total_amount', 'status', 'order_type', 'people_count', 'payment_method',
+        'member_phone', 'customer_name', 'invoice_id', 'carrier_id', 'data_source',
+        'Day_Type', 'Period', 'Member_ID', 'Order_Category', 'main_dish_count'
+    ], defaults={'total_amount': 0, 'people_count': 1, 'data_source': 'csv', 'main_dish_count': 0})
         
     insert_query = """
     INSERT INTO orders_fact (
@@ -138,34 +129,14 @@ def transform_and_load_details(df_details):
     # Get order IDs to upsert
     order_ids = df_details['order_id'].dropna().unique().tolist()
     
-    # Pre-process data
-    records_to_insert = []
-    
     # Convert NaN to None
     df_details = df_details.replace({float('nan'): None, '': None})
     
-    for _, row in df_details.iterrows():
-        # Process date
-        date_val = row['Date_Parsed'] if pd.notna(row['Date_Parsed']) else row.get('date')
-        if pd.isna(date_val): 
-            continue
-            
-        record = (
-            row.get('order_id'),
-            date_val,
-            row.get('item_name'),
-            row.get('category'),
-            row.get('sku'),
-            row.get('item_type'),
-            row.get('item_total', 0),
-            row.get('qty', 0),
-            row.get('unit_price', 0),
-            row.get('options'),
-            row.get('Is_Modifier', False),
-            row.get('Is_Main_Dish', False),
-            row.get('data_source', 'csv')
-        )
-        records_to_insert.append(record)
+    # Build rows column-wise (rows without a date are skipped)
+    records_to_insert = build_records(df_details, [
+        'order_id', 'item_name', 'category', 'sku', 'item_type', 'item_total', 'qty',
+        'unit_price', 'options', 'Is_Modifier', 'Is_Main_Dish', 'data_source'
+    ], defaults={'item_total': 0, 'qty': 0, 'unit_price': 0, 'Is_Modifier': False, 'Is_Main_Dish': False, 'data_source': 'csv'})
         
     insert_query = """
     INSERT INTO order_details_fact (
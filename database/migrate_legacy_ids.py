@@ -0,0 +1,88 @@
+"""一次性遷移：回填舊版 loader 以數字推斷 ID 欄位時寫入的資料。
+
+舊版 loader 讀 CSV 時把單號、電話欄位推斷成數字：
+  - 欄位有空白時單號變成 '101.0'，不符合 YYYYMMDD-oid-HHMM 前綴規則而直接存入
+  - 電話掉了開頭的 0，並可能多出 '.0'（'912345678.0' → member_id 'CRM_912345678.0'）
+現在這些欄位以文字讀入（'20240208-101-1230'、'0912345678'），既有資料需改寫一次，
+避免同一位客人 / 同一筆訂單在 DB 裡出現兩種 ID。
+
+只需手動執行一次（不在 ETL 流程內）：
+    cd database && python migrate_legacy_ids.py
+
+限制：8 碼以下的舊電話無法判斷是否掉了開頭的 0，維持去掉 '.0' 後的數字。
+"""
+from data_pipeline import (
+    acquire_lock, release_lock, connect_to_db, normalize_member_phones, update_daily_revenue_agg
+)
+
+
+def legacy_order_id_sql(t):
+    """SQL for the current key of a legacy order_id like '101.0' in table alias t (mirrors _make_unique_order_ids)."""
+    n = f"SPLIT_PART({t}.order_id, '.', 1)"
+    return f"""CASE WHEN LENGTH({n}) <= 4
+                THEN TO_CHAR({t}.date, 'YYYYMMDD') || '-' || {n} || '-' || TO_CHAR({t}.date, 'HH24MI')
+                ELSE {n} END"""
+
+
+def migrate_legacy_numeric_ids():
+    """把舊格式的電話與單號改寫成目前 loader 產生的格式。已改寫過的資料不會再符合條件。"""
+    legacy_id = r"'^[0-9]+\.0$'"
+    conn = connect_to_db()
+    with conn.cursor() as cur:
+        # 1. 電話：去掉 '.0'；9 碼且開頭不是 0 的是被吃掉開頭 0 的 10 碼號碼 (09xx / 02)
+        cur.execute(r"""
+            UPDATE orders_fact
+            SET member_phone = CASE
+                    WHEN member_phone ~ '^[1-9][0-9]{8}(\.0)?$' THEN '0' || SPLIT_PART(member_phone, '.', 1)
+                    ELSE SPLIT_PART(member_phone, '.', 1)
+                END
+            WHERE member_phone ~ '^[1-9][0-9]{8}(\.0)?$'
+               OR member_phone ~ '^[0-9]+\.0$'
+        """)
+        phone_updated = cur.rowcount
+        # CRM_ member_id 由 main() 接著呼叫的 normalize_member_phones() 依 member_phone 同步
+
+        # 2. 單號：新格式的訂單已存在（檔案重新匯入過）就刪掉舊列，其餘改寫成新 key
+        cur.execute(f"""
+            DELETE FROM orders_fact o
+            WHERE o.order_id ~ {legacy_id}
+              AND EXISTS (SELECT 1 FROM orders_fact n WHERE n.order_id = {legacy_order_id_sql('o')})
+        """)
+        order_dropped = cur.rowcount
+        cur.execute(f"""
+            UPDATE orders_fact o
+            SET order_id = {legacy_order_id_sql('o')}
+            WHERE o.order_id ~ {legacy_id}
+        """)
+        order_updated = cur.rowcount
+
+        # 3. 明細：同上，明細是整張訂單覆寫，新 key 已有明細時舊列直接刪除
+        cur.execute(f"""
+            DELETE FROM order_details_fact d
+            WHERE d.order_id ~ {legacy_id}
+              AND EXISTS (SELECT 1 FROM order_details_fact n WHERE n.order_id = {legacy_order_id_sql('d')})
+        """)
+        detail_dropped = cur.rowcount
+        cur.execute(f"""
+            UPDATE order_details_fact d
+            SET order_id = {legacy_order_id_sql('d')}
+            WHERE d.order_id ~ {legacy_id}
+        """)
+        detail_updated = cur.rowcount
+    conn.commit()
+    conn.close()
+    print(f"✅ 回填舊格式 ID：{phone_updated} 筆電話、{order_updated} 筆訂單改寫 ({order_dropped} 筆重複刪除)、"
+          f"{detail_updated} 筆明細改寫 ({detail_dropped} 筆重複刪除)。")
+
+
+def main():
+    acquire_lock()  # 與 ETL 共用 lock，避免遷移途中有新資料寫入
+    try:
+        migrate_legacy_numeric_ids()
+        normalize_member_phones()
+        update_daily_revenue_agg()  # 重複訂單刪除後重算每日彙總
+    finally:
+        release_lock()
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,12 @@ import pandas as pd
 from datetime import datetime
 from config import APP_VERSION
 from views import operational, member, system, sales, prediction
+from views.utils import render_date_filter
 import db_queries
 
+# Copy-on-Write: filtered slices in the views share memory until written, so no defensive .copy() is needed
+pd.options.mode.copy_on_write = True
+
 # --- 1. Config ---
 st.set_page_config(
     page_title=f"滾麵智慧營運報表 v{APP_VERSION}",
@@ -32,14 +36,17 @@ def check_db_health():
         
     return logs, latest_dates
 
+def reconnect_db():
+    # Runs as a button callback, before the rerun the click already triggers
+    st.cache_resource.clear()
+    # Drop cached query results too, so every page re-reads through the new connection
+    st.cache_data.clear()
+
 # --- 3. Main App ---
 def main():
     st.sidebar.title(f"🍜 滾麵 Dashboard v{APP_VERSION}")
     
-    if st.sidebar.button("🔄 強制重新連線資料庫"):
-        st.cache_resource.clear()
-        check_db_health.clear()
-        st.rerun()
+    st.sidebar.button("🔄 強制重新連線資料庫", on_click=reconnect_db)
     
     with st.spinner('連線遠端 PostgreSQL 資料庫中...'):
         health_logs, latest_dates = check_db_health()
@@ -69,7 +76,6 @@ def main():
         
     elif view_mode == "🍟 商品銷售分析":
         st.subheader("📅 銷售分析區間")
-        from views.utils import render_date_filter
         s_date, e_date = render_date_filter("sales", "近2週 (Last 2 Weeks)")
         sales.render_sales_view(s_date, e_date)
             
@@ -1,3 +1,4 @@
+import functools
 import psycopg2
 import pandas as pd
 import streamlit as st
@@ -14,21 +15,50 @@ def get_db_connection():
     )
     return conn
 
+def read_sql(query, params=None):
+    """Runs a query into a DataFrame; errors propagate to the caller."""
+    conn = get_db_connection()
+    if conn.closed:
+        st.cache_resource.clear()
+        conn = get_db_connection()
+    return pd.read_sql(query, conn, params=params)
+
 def fetch_data(query, params=None):
     """Helper method to fetch data via Pandas read_sql safely."""
-    conn = get_db_connection()
     try:
-        if conn.closed:
-            st.cache_resource.clear()
-            conn = get_db_connection()
-        return pd.read_sql(query, conn, params=params)
+        return read_sql(query, params)
     except Exception as e:
         st.error(f"Database query failed: {e}")
         return pd.DataFrame()
 
+def cached_query(ttl=300):
+    """st.cache_data for the fetch_* helpers that only keeps successful results.
+
+    The helper body runs read_sql, so a failed query raises out of the cache and nothing is stored
+    (st.cache_data is shared by every session; a cached empty frame would blank every page until the TTL).
+    The failure is reported like fetch_data: st.error and an empty DataFrame, on this rerun only.
+    `.cached` is the cached call without that handling, for use inside other cached functions.
+    """
+    def decorate(func):
+        cached = st.cache_data(ttl=ttl, show_spinner=False)(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return cached(*args, **kwargs)
+            except Exception as e:
+                st.error(f"Database query failed: {e}")
+                return pd.DataFrame()
+
+        wrapper.cached = cached
+        wrapper.clear = cached.clear
+        return wrapper
+    return decorate
+
 # ---------------------------------------------------------
 # Daily Revenue Aggregation Queries (Used by Operational/Prediction)
 # ---------------------------------------------------------
+@cached_query()
 def fetch_daily_revenue_agg(start_date=None, end_date=None):
     """Fetch daily aggregated revenue metrics for operational views."""
     query = "SELECT * FROM daily_revenue_agg"
@@ -39,8 +69,9 @@ def fetch_daily_revenue_agg(start_date=None, end_date=None):
         params.extend([start_date, end_date])
         
     query += " ORDER BY date DESC"
-    return fetch_data(query, params)
+    return read_sql(query, params)
 
+@cached_query()
 def fetch_daily_revenue_trend(start_date, end_date):
     """Fetch order category trends, ensuring date formatting corresponds."""
     query = """
@@ -50,37 +81,39 @@ def fetch_daily_revenue_trend(start_date, end_date):
     GROUP BY date, order_category
     ORDER BY date ASC
     """
-    return fetch_data(query, [start_date, end_date])
+    return read_sql(query, [start_date, end_date])
     
-def fetch_daily_breakdown(start_date, end_date):
-    """Fetch detailed orders fact table to calculate arbitrary breakouts on the frontend."""
+@cached_query()
+def fetch_daily_revenue_by_day_type(start_date, end_date):
+    """Fetch revenue per calendar day and day type (weekday/holiday), summed in the database."""
     query = """
-    SELECT date AS "Date_Parsed", date::DATE AS "Date_Only", total_amount, people_count, order_type, 
-           day_type AS "Day_Type", period AS "Period", order_category AS "Order_Category", main_dish_count
+    SELECT date::DATE AS "Date_Only", day_type AS "Day_Type", COALESCE(SUM(total_amount), 0) AS total_amount
     FROM orders_fact
     WHERE date >= %s AND date <= %s
+    GROUP BY date::DATE, day_type
     """
-    # Expose necessary columns like how df_rep worked for operational views
-    return fetch_data(query, [start_date, end_date])
+    return read_sql(query, [start_date, end_date])
 
 # ---------------------------------------------------------
 # Item Details Queries (Used by Sales analysis)
 # ---------------------------------------------------------
+@cached_query()
 def fetch_sales_details(start_date, end_date):
-    """Fetch order details for the product sales analysis component."""
+    """Fetch order details for the product sales analysis component (only the columns the page reads)."""
     query = """
-    SELECT date AS "Date_Parsed", item_name, category, sku, item_type,
-           item_total, qty, unit_price, is_modifier AS "Is_Modifier", is_main_dish AS "Is_Main_Dish"
+    SELECT date AS "Date_Parsed", item_name, category, sku,
+           item_total, qty, is_modifier AS "Is_Modifier"
     FROM order_details_fact
     WHERE date >= %s AND date <= %s
     """
-    return fetch_data(query, [start_date, end_date])
+    return read_sql(query, [start_date, end_date])
 
 # ---------------------------------------------------------
 # Member Profile & CRM Queries (Used by Member/CRM panels)
 # ---------------------------------------------------------
+@cached_query(ttl=600)
 def fetch_member_search(keyword):
-    """Returns candidate members matching the name, phone, carrier or ID."""
+    """Returns candidate members matching the name, phone, carrier or ID (cached per keyword across reruns)."""
     query = """
     SELECT 
         customer_name, 
@@ -96,8 +129,9 @@ def fetch_member_search(keyword):
     LIMIT 100
     """
     term = f"%{keyword}%"
-    return fetch_data(query, [term, term, term, term])
+    return read_sql(query, [term, term, term, term])
 
+@cached_query()
 def fetch_member_transactions(member_id):
     """Fetch history of orders completely owned by the single member ID."""
     query = """
@@ -106,8 +140,9 @@ def fetch_member_transactions(member_id):
     WHERE member_id = %s
     ORDER BY date DESC
     """
-    return fetch_data(query, [member_id])
+    return read_sql(query, [member_id])
 
+@cached_query()
 def fetch_member_fav_items(member_id):
     """Fetch the top items purchased historically by this member."""
     query = """
@@ -120,8 +155,9 @@ def fetch_member_fav_items(member_id):
     ORDER BY SUM(qty) DESC
     LIMIT 5
     """
-    return fetch_data(query, [member_id])
+    return read_sql(query, [member_id])
 
+@cached_query()
 def fetch_crm_tx_data(start_date, end_date):
     """Fetch all transaction instances within the period to evaluate CRM."""
     query = """
@@ -137,8 +173,9 @@ def fetch_crm_tx_data(start_date, end_date):
     FROM orders_fact
     WHERE date >= %s AND date <= %s
     """
-    return fetch_data(query, [start_date, end_date])
+    return read_sql(query, [start_date, end_date])
     
+@cached_query()
 def fetch_all_time_active_members():
     """Fetch first-visit dates for all known valid members across the platform lifecycle."""
     query = """
@@ -147,8 +184,9 @@ def fetch_all_time_active_members():
     WHERE member_id IS NOT NULL AND member_id != '' AND member_id != '\u975e\u6703\u54e1'
     GROUP BY member_id
     """
-    return fetch_data(query)
+    return read_sql(query)
 
+@cached_query()
 def fetch_crm_details_items(start_date, end_date):
     """Fetch only main dishes for active members in the time range to find specific crowd favorites."""
     query = """
@@ -158,8 +196,9 @@ def fetch_crm_details_items(start_date, end_date):
     WHERE d.date >= %s AND d.date <= %s
       AND d.is_main_dish = TRUE
     """
-    return fetch_data(query, [start_date, end_date])
+    return read_sql(query, [start_date, end_date])
 
+@cached_query()
 def fetch_rolling_member_revenue():
     """Fetches total daily revenue segmented by Member or Non-Member to power the 28-day rolling CRM widget."""
     query = """
@@ -171,8 +210,9 @@ def fetch_rolling_member_revenue():
     GROUP BY date::DATE, COALESCE(member_id, '非會員')
     ORDER BY date::DATE ASC
     """
-    return fetch_data(query)
+    return read_sql(query)
 
+@cached_query()
 def fetch_data_freshness():
     """Fetch the latest dates per data source from the data_freshness metadata table."""
     query = """
@@ -187,7 +227,7 @@ def fetch_data_freshness():
             ELSE 5
         END
     """
-    return fetch_data(query)
+    return read_sql(query)
 
 def fetch_system_logs():
     """Simple count query to verify DB is reachable."""
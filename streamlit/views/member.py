@@ -6,6 +6,13 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import timedelta
 import db_queries
+from .utils import render_date_filter
+
+def classify_user_type(txs, start_ts):
+    """Labels each transaction as non-member, new or returning from the member's first visit date."""
+    is_guest = (txs['Member_ID'] == '非會員') | txs['First_Visit_Date'].isna()
+    is_new = txs['First_Visit_Date'].dt.normalize() >= start_ts.normalize()
+    return np.select([is_guest, is_new], ['非會員 (Non-member)', '新客 (New)'], default='舊客 (Returning)')
 
 def render_member_search(latest_dates=None):
     st.title("👥 會員消費紀錄查詢")
@@ -21,17 +28,14 @@ def render_member_search(latest_dates=None):
         candidates = db_queries.fetch_member_search(s_clean)
         
         if not candidates.empty:
-            def make_label(row):
-                n = str(row.get('customer_name', '')) if row.get('customer_name') else '-'
-                p = str(row.get('member_phone', '')) if row.get('member_phone') else '-'
-                c = str(row.get('carrier_id', '')) if row.get('carrier_id') else '-'
-                mid = str(row.get('Member_ID', ''))
-                
-                label = f"{n} / {p} / {c}"
-                return f"{label} (ID: {mid})"
-
-            unique_members = candidates.drop_duplicates(subset=['Member_ID']).copy()
-            unique_members['Label'] = unique_members.apply(make_label, axis=1)
+            unique_members = candidates.drop_duplicates(subset=['Member_ID'])
+            # Labels are concatenated column-wise; NULL or blank fields show as '-'
+            parts = unique_members[['customer_name', 'member_phone', 'carrier_id']]
+            parts = parts.astype(str).where(parts.notna() & parts.ne(''), '-')
+            unique_members['Label'] = (
+                parts['customer_name'] + ' / ' + parts['member_phone'] + ' / ' + parts['carrier_id']
+                + ' (ID: ' + unique_members['Member_ID'].astype(str) + ')'
+            )
             
             sel_label = st.selectbox(f"找到 {len(unique_members)} 位相關會員:", unique_members['Label'].tolist())
             
@@ -57,7 +61,7 @@ def render_member_search(latest_dates=None):
                 c4.metric("最近來店", str(last_visit))
                 
                 st.subheader("🧾 消費歷程")
-                hist_df = mem_records[['Date_Parsed', 'order_id', 'total_amount', 'order_type', 'customer_name']].copy()
+                hist_df = mem_records[['Date_Parsed', 'order_id', 'total_amount', 'order_type', 'customer_name']]
                 st.dataframe(hist_df.style.format({'total_amount': '${:,.0f}', 'Date_Parsed': '{:%Y-%m-%d %H:%M}'}), use_container_width=True)
                 
                 fav_items = db_queries.fetch_member_fav_items(sel_mid)
@@ -74,9 +78,7 @@ def render_crm_analysis(latest_dates=None):
     # --- Data Freshness Banner ---
     freshness = db_queries.fetch_data_freshness()
     if not freshness.empty:
-        dates_map = {}
-        for _, row in freshness.iterrows():
-            dates_map[row['source_key']] = str(row['latest_date'])
+        dates_map = dict(zip(freshness['source_key'], map(str, freshness['latest_date'])))
             
         json_date = dates_map.get('json', 'N/A')
         rep_date = dates_map.get('csv_report', 'N/A')
@@ -106,7 +108,6 @@ def render_crm_analysis(latest_dates=None):
     st.divider()
     
     st.subheader("🗓️ 單期綜合分析區間")
-    from .utils import render_date_filter
     s_date, e_date = render_date_filter("crm_tab1", "這個月 (This Month)")
     
     period_txs = db_queries.fetch_crm_tx_data(s_date, e_date)
@@ -115,8 +116,9 @@ def render_crm_analysis(latest_dates=None):
         st.warning("此區間無交易資料")
         return
         
-    global_first_visits = db_queries.fetch_all_time_active_members()
-    global_first_visits = global_first_visits[['Member_ID', 'First_Visit_Date']]
+    # Fetched once: first visits feed the user types, global frequency feeds the RFM segments
+    all_time_members = db_queries.fetch_all_time_active_members()
+    global_first_visits = all_time_members[['Member_ID', 'First_Visit_Date']]
     
     period_txs = period_txs.merge(global_first_visits, on='Member_ID', how='left')
     
@@ -127,16 +129,7 @@ def render_crm_analysis(latest_dates=None):
     start_ts = pd.Timestamp(s_date)
     end_ts = pd.Timestamp(e_date)
     
-    def determine_type(row):
-        if row['Member_ID'] == '非會員':
-            return '非會員 (Non-member)'
-        if pd.isna(row['First_Visit_Date']):
-            return '非會員 (Non-member)'
-        if row['First_Visit_Date'].date() >= start_ts.date():
-            return '新客 (New)'
-        return '舊客 (Returning)'
-        
-    period_txs['User_Type'] = period_txs.apply(determine_type, axis=1)
+    period_txs['User_Type'] = classify_user_type(period_txs, start_ts)
     
     def get_visit_id(row):
         if row['User_Type'] == '非會員 (Non-member)':
@@ -146,12 +139,11 @@ def render_crm_analysis(latest_dates=None):
             
     period_txs['Visit_ID'] = period_txs.apply(get_visit_id, axis=1)
     
-    type_counts = period_txs.groupby('User_Type')['Visit_ID'].nunique()
-    
     rev_by_type = period_txs.groupby('User_Type').agg(
         Total_Revenue=('total_amount', 'sum'),
         Tx_Count=('Visit_ID', 'nunique')
     ).reset_index()
+    type_counts = rev_by_type.set_index('User_Type')['Tx_Count']
     
     def get_stat(df, c, v):
         res = df.loc[df['User_Type'] == c, v]
@@ -217,12 +209,15 @@ def render_crm_analysis(latest_dates=None):
         types_to_show = ['新客 (New)', '舊客 (Returning)', '非會員 (Non-member)']
         cols = st.columns(3)
         
+        # One pass over the details for all user types, split per type afterwards
+        item_qty = curr_details.groupby(['User_Type', 'item_name'])['qty'].sum()
+        qty_by_type = {u_type: qty.droplevel('User_Type') for u_type, qty in item_qty.groupby(level='User_Type')}
+        
         for i, u_type in enumerate(types_to_show):
             with cols[i]:
                 st.markdown(f"**{u_type}**")
-                df_u = curr_details[curr_details['User_Type'] == u_type]
-                if not df_u.empty:
-                    top_items = df_u.groupby('item_name')['qty'].sum().reset_index().sort_values('qty', ascending=False).head(5)
+                if u_type in qty_by_type:
+                    top_items = qty_by_type[u_type].reset_index().sort_values('qty', ascending=False).head(5)
                     st.dataframe(top_items.rename(columns={'item_name': '餐點', 'qty': '數量'}).set_index('餐點'), use_container_width=True)
                 else:
                     st.caption("無資料")
@@ -232,7 +227,9 @@ def render_crm_analysis(latest_dates=None):
     st.divider()
     
     st.subheader("📈 日常客群來店趨勢")
-    daily_type = period_txs.groupby(['Date_Only', 'User_Type'])['Visit_ID'].nunique().reset_index()
+    # Group on midnight timestamps (int64 keys) rather than the Python date objects in Date_Only
+    visit_day = period_txs['Date_Parsed'].dt.normalize().rename('Date_Only')
+    daily_type = period_txs.groupby([visit_day, 'User_Type'])['Visit_ID'].nunique().reset_index()
     daily_type.rename(columns={'Visit_ID': 'Visits'}, inplace=True)
     
     fig_time = px.bar(daily_type, x='Date_Only', y='Visits', color='User_Type', title="每日客群來訪數", barmode='stack')
@@ -251,6 +248,8 @@ def render_crm_analysis(latest_dates=None):
         return
         
     rfm_member_txs = rfm_period_txs.merge(global_first_visits, on='Member_ID', how='left')
+    # Member_ID is the grouping key below; categorical codes hash far cheaper than the ID strings
+    rfm_member_txs['Member_ID'] = rfm_member_txs['Member_ID'].astype('category')
     rfm_member_txs['Date_Parsed'] = pd.to_datetime(rfm_member_txs['Date_Parsed'])
     rfm_member_txs['First_Visit_Date'] = pd.to_datetime(rfm_member_txs['First_Visit_Date'])
     rfm_member_txs['Date_Only'] = rfm_member_txs['Date_Parsed'].dt.date
@@ -258,16 +257,7 @@ def render_crm_analysis(latest_dates=None):
     rfm_start_ts = pd.Timestamp(rfm_s_date)
     rfm_end_ts = pd.Timestamp(rfm_e_date)
     
-    def determine_rfm_type(row):
-        if row['Member_ID'] == '非會員':
-            return '非會員 (Non-member)'
-        if pd.isna(row['First_Visit_Date']):
-            return '非會員 (Non-member)'
-        if row['First_Visit_Date'].date() >= rfm_start_ts.date():
-            return '新客 (New)'
-        return '舊客 (Returning)'
-        
-    rfm_member_txs['User_Type'] = rfm_member_txs.apply(determine_rfm_type, axis=1)
+    rfm_member_txs['User_Type'] = classify_user_type(rfm_member_txs, rfm_start_ts)
     
     def get_rfm_visit_id(row):
         if row['User_Type'] == '非會員 (Non-member)':
@@ -277,7 +267,7 @@ def render_crm_analysis(latest_dates=None):
             
     rfm_member_txs['Visit_ID'] = rfm_member_txs.apply(get_rfm_visit_id, axis=1)
 
-    freq = rfm_member_txs.groupby('Member_ID')['Visit_ID'].nunique().reset_index()
+    freq = rfm_member_txs.groupby('Member_ID', observed=True, sort=False)['Visit_ID'].nunique().reset_index()
     freq['Frequency'] = pd.cut(freq['Visit_ID'], bins=[0, 1, 2, 5, 100], labels=['1次', '2次', '3-5次', '6次+'])
     
     user_type_map = rfm_member_txs[['Member_ID', 'User_Type']].drop_duplicates()
@@ -295,13 +285,13 @@ def render_crm_analysis(latest_dates=None):
     exclude_ue = st.toggle("過濾外送平台 (UberEats等)", value=False, help="開啟後，圖表中將不包含前綴為 UE_ 的會員")
     
     # 確保排除非會員
-    interval_txs = rfm_member_txs[rfm_member_txs['Member_ID'] != '非會員'].copy()
+    interval_txs = rfm_member_txs[rfm_member_txs['Member_ID'] != '非會員']
     
     if exclude_ue:
-        interval_txs = interval_txs[~interval_txs['Member_ID'].astype(str).str.startswith('UE_')]
+        interval_txs = interval_txs[~interval_txs['Member_ID'].str.startswith('UE_')]
     
     if not interval_txs.empty:
-        rfm = interval_txs.groupby('Member_ID').agg(
+        rfm = interval_txs.groupby('Member_ID', observed=True).agg(
             Last_Purchase=('Date_Parsed', 'max'),
             Frequency=('Visit_ID', 'nunique'),
             Monetary=('total_amount', 'sum')
@@ -311,26 +301,22 @@ def render_crm_analysis(latest_dates=None):
         rfm['Days_Since_First_Visit'] = (pd.Timestamp(rfm_end_ts.date()) - pd.to_datetime(rfm['First_Visit_Date']).dt.normalize()).dt.days
         rfm['First_Visit_Str'] = pd.to_datetime(rfm['First_Visit_Date']).dt.strftime('%Y-%m-%d')
         
-        global_all_freq = db_queries.fetch_all_time_active_members()
-        rfm = rfm.merge(global_all_freq[['Member_ID', 'Frequency_Global']], on='Member_ID', how='left')
+        rfm = rfm.merge(all_time_members[['Member_ID', 'Frequency_Global']], on='Member_ID', how='left')
         
         # Recency 根據最新一筆消費距離結束日期的天數計算
         rfm['Recency'] = (pd.Timestamp(rfm_end_ts.date()) - pd.to_datetime(rfm['Last_Purchase']).dt.normalize()).dt.days
         rfm['Recency'] = rfm['Recency'].clip(lower=0)
         
-        def segment_rfm(row):
-            # NEW RFM Definitions Based on Global Frequency and 30 Day Recency
-            f = row['Frequency_Global']
-            r = row['Recency']
-            
-            if f > 4:
-                return "Champions (主力常客)" if r <= 30 else "At Risk (流失預警)"
-            elif 2 <= f <= 4:
-                return "Potential (潛力新星)" if r <= 30 else "潛力客群"
-            else:
-                return "New (新客)" if r <= 30 else "One-time (一次客)"
-                
-        rfm['Segment'] = rfm.apply(segment_rfm, axis=1)
+        # NEW RFM Definitions Based on Global Frequency and 30 Day Recency
+        f = rfm['Frequency_Global']
+        recent = rfm['Recency'] <= 30
+        is_loyal = f > 4
+        is_repeat = (f >= 2) & (f <= 4)
+        rfm['Segment'] = np.select(
+            [is_loyal & recent, is_loyal, is_repeat & recent, is_repeat, recent],
+            ["Champions (主力常客)", "At Risk (流失預警)", "Potential (潛力新星)", "潛力客群", "New (新客)"],
+            default="One-time (一次客)"
+        )
         
         color_map = {
             "Champions (主力常客)": "#7FCCB5",
@@ -356,7 +342,7 @@ def render_crm_analysis(latest_dates=None):
         seg_counts = rfm['Segment'].value_counts().reset_index()
         seg_counts.columns = ['會員價值分群', '人數']
         
-        seg_m = rfm.groupby('Segment')['Monetary'].mean().reset_index()
+        seg_m = rfm.groupby('Segment', sort=False)['Monetary'].mean().reset_index()
         seg_counts = seg_counts.merge(seg_m, left_on='會員價值分群', right_on='Segment')
         
         col_rfm1, col_rfm2 = st.columns([1, 1])
@@ -371,7 +357,6 @@ def render_crm_analysis(latest_dates=None):
     st.divider()
     
     st.subheader("🗓️ 歷史走勢觀察區間")
-    from .utils import render_date_filter
     s_date_t2, e_date_t2 = render_date_filter("crm_trend", "這個月 (This Month)")
     start_ts_t2 = pd.Timestamp(s_date_t2)
     end_ts_t2 = pd.Timestamp(e_date_t2)
@@ -381,25 +366,29 @@ def render_crm_analysis(latest_dates=None):
     all_daily_rev = db_queries.fetch_rolling_member_revenue()
     
     if not all_daily_rev.empty:
-        all_daily_rev['Date_Only'] = pd.to_datetime(all_daily_rev['Date_Only']).dt.date
+        # Days are parsed once; the datetime64 values feed the first-visit test so the python dates
+        # kept for grouping and display never have to be parsed back. The left merge keeps row order.
+        day = pd.to_datetime(all_daily_rev['Date_Only'])
+        all_daily_rev['Date_Only'] = day.dt.date
         all_daily_rev = all_daily_rev.merge(global_first_visits, on='Member_ID', how='left')
         
-        def assign_global_type(row):
-            if row['Member_ID'] == '非會員': return '非會員 (Non-member)'
-            if pd.isna(row['First_Visit_Date']): return '非會員 (Non-member)'
-            if row['Date_Only'] == pd.to_datetime(row['First_Visit_Date']).date(): return '新客 (New)'
-            return '舊客 (Returning)'
-            
-        all_daily_rev['Global_Type'] = all_daily_rev.apply(assign_global_type, axis=1)
+        first_visit_day = pd.to_datetime(all_daily_rev['First_Visit_Date']).dt.normalize()
+        is_guest = (all_daily_rev['Member_ID'] == '非會員') | first_visit_day.isna()
+        is_first_day = day.to_numpy() == first_visit_day.to_numpy()
+        # Fixed categories: the groupby hashes int codes and the unstack always yields all three type columns
+        all_daily_rev['Global_Type'] = pd.Categorical(
+            np.select([is_guest, is_first_day], ['非會員 (Non-member)', '新客 (New)'], default='舊客 (Returning)'),
+            categories=['新客 (New)', '舊客 (Returning)', '非會員 (Non-member)']
+        )
         
-        daily_rev = all_daily_rev.groupby(['Date_Only', 'Global_Type'])['daily_rev'].sum().unstack(fill_value=0).reset_index()
-        for c in ['新客 (New)', '舊客 (Returning)', '非會員 (Non-member)']:
-            if c not in daily_rev.columns: daily_rev[c] = 0
+        daily_rev = all_daily_rev.groupby(['Date_Only', 'Global_Type'], observed=False)['daily_rev'].sum().unstack(fill_value=0)
+        daily_rev.columns = daily_rev.columns.astype(object)
+        daily_rev = daily_rev.reset_index()
             
         daily_rev = daily_rev.sort_values('Date_Only')
         active_days = daily_rev['Date_Only'].values
         
-        rolling_df = daily_rev.copy()
+        rolling_df = daily_rev
         rolling_df['新客營收總和 (28日)'] = rolling_df['新客 (New)'].rolling(window=28, min_periods=1).sum()
         rolling_df['舊客營收總和 (28日)'] = rolling_df['舊客 (Returning)'].rolling(window=28, min_periods=1).sum()
         rolling_df['非會員營收總和 (28日)'] = rolling_df['非會員 (Non-member)'].rolling(window=28, min_periods=1).sum()
@@ -409,11 +398,14 @@ def render_crm_analysis(latest_dates=None):
         
         rolling_df['舊客會員內貢獻 (28日)'] = rolling_df['舊客營收總和 (28日)'] / rolling_df['會員總和_Safe']
         
-        mask_period = (pd.to_datetime(rolling_df['Date_Only']) >= start_ts_t2) & (pd.to_datetime(rolling_df['Date_Only']) <= end_ts_t2)
-        plot_df = rolling_df.loc[mask_period].copy()
+        # rolling_df is sorted by day, so both windows are positional slices found by binary search
+        day_ts = pd.to_datetime(rolling_df['Date_Only'])
+        i_start = day_ts.searchsorted(start_ts_t2)
+        i_end = day_ts.searchsorted(end_ts_t2, side='right')
+        plot_df = rolling_df.iloc[i_start:i_end]
         
         if not plot_df.empty:
-            recent_stats = rolling_df[pd.to_datetime(rolling_df['Date_Only']) <= end_ts_t2]
+            recent_stats = rolling_df.iloc[:i_end]
             
             if not recent_stats.empty:
                 latest_row = recent_stats.iloc[-1]
@@ -427,9 +419,12 @@ def render_crm_analysis(latest_dates=None):
                 if len(idx) > 0:
                     end_idx = idx[0]
                     start_idx = max(0, end_idx - 27)
-                    window_days = active_days[start_idx : end_idx + 1]
-                    
-                    window_df = all_daily_rev[(all_daily_rev['Date_Only'].isin(window_days)) & (all_daily_rev['Member_ID'] != '非會員')]
+                    # active_days holds every trading day, so the window is just its first..last range;
+                    # all_daily_rev comes back in date order, so that range is a positional slice
+                    i_lo = all_daily_rev['Date_Only'].searchsorted(active_days[start_idx])
+                    i_hi = all_daily_rev['Date_Only'].searchsorted(active_days[end_idx], side='right')
+                    window_df = all_daily_rev.iloc[i_lo:i_hi]
+                    window_df = window_df[window_df['Member_ID'] != '非會員']
                     unique_members_28d = window_df['Member_ID'].nunique()
                 else:
                     unique_members_28d = 0
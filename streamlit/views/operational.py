@@ -1,31 +1,35 @@
 import streamlit as st
 import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 import pandas as pd
 import numpy as np
-from .utils import calculate_delta
+from .utils import calculate_delta, render_date_filter
 import db_queries
 
 def render_operational_view():
     st.title("📊 營運總覽")
     
     # --- Local Date Filter ---
-    from .utils import render_date_filter
     start_date, end_date = render_date_filter("ops", "近2週 (Last 2 Weeks)")
     
     st.divider()
 
-    # Query Pre-Aggregated PostgreSQL Table
-    df_agg = db_queries.fetch_daily_revenue_agg(start_date, end_date)
+    # Previous Period (same length, directly before)
+    duration = end_date - start_date
+    prev_end = start_date - pd.Timedelta(days=1)
+    prev_start = prev_end - duration
+    
+    # Query Pre-Aggregated PostgreSQL Table once for both periods. Rows come newest first,
+    # so the current period is the leading block and the previous period the rest.
+    df_both = db_queries.fetch_daily_revenue_agg(prev_start, end_date)
+    n_curr = int((pd.to_datetime(df_both['date']) >= start_date).sum()) if not df_both.empty else 0
+    df_agg = df_both.iloc[:n_curr]
+    df_prev_agg = df_both.iloc[n_curr:].reset_index(drop=True)
     
     if df_agg.empty:
         st.warning(f"此區間無營運資料 ({start_date.date()} ~ {end_date.date()})")
         return
-        
-    # Previous Period Query
-    duration = end_date - start_date
-    prev_end = start_date - pd.Timedelta(days=1)
-    prev_start = prev_end - duration
-    df_prev_agg = db_queries.fetch_daily_revenue_agg(prev_start, prev_end)
 
     # -------------------------------------------------------------
     # 1. Top Level Metrics
@@ -64,8 +68,10 @@ def render_operational_view():
         df_trend = db_queries.fetch_daily_revenue_trend(start_date, end_date)
         if not df_trend.empty:
             df_trend['Date_Parsed'] = pd.to_datetime(df_trend['Date_Parsed'])
-            resampled = df_trend.groupby(['Order_Category', pd.Grouper(key='Date_Parsed', freq=ov_freq)])['total_amount'].sum().reset_index()
-            total_resampled = df_trend.groupby(pd.Grouper(key='Date_Parsed', freq=ov_freq))['total_amount'].sum().reset_index()
+            # Single aggregation pass: the total line is the per-bin sum of the category bars, padded to every bin
+            by_category = df_trend.groupby(['Order_Category', pd.Grouper(key='Date_Parsed', freq=ov_freq)], dropna=False)['total_amount'].sum()
+            resampled = by_category.reset_index().dropna(subset=['Order_Category'])
+            total_resampled = by_category.groupby(level='Date_Parsed').sum().asfreq(ov_freq, fill_value=0).reset_index()
             
             fig = px.bar(
                 resampled, 
@@ -76,7 +82,6 @@ def render_operational_view():
                 labels={'total_amount': '金額', 'Date_Parsed': '日期', 'Order_Category': '點餐類型'}
             )
             
-            import plotly.graph_objects as go
             fig.add_trace(go.Scatter(
                 x=total_resampled['Date_Parsed'],
                 y=total_resampled['total_amount'],
@@ -93,16 +98,15 @@ def render_operational_view():
 
     with col_R:
         st.subheader("📅 平假日平均 (vs 上期)")
-        df_raw = db_queries.fetch_daily_breakdown(start_date, end_date)
-        df_raw_prev = db_queries.fetch_daily_breakdown(prev_start, prev_end)
+        # One row per (day, day type), already summed by PostgreSQL
+        daily_rev = db_queries.fetch_daily_revenue_by_day_type(start_date, end_date)
+        daily_rev_prev = db_queries.fetch_daily_revenue_by_day_type(prev_start, prev_end)
         
-        if not df_raw.empty and 'Day_Type' in df_raw.columns:
-            daily_rev = df_raw.groupby(['Date_Only', 'Day_Type'])['total_amount'].sum().reset_index()
-            curr_type_avg = daily_rev.groupby('Day_Type')['total_amount'].mean()
+        if not daily_rev.empty and 'Day_Type' in daily_rev.columns:
+            curr_type_avg = daily_rev.groupby('Day_Type', sort=False)['total_amount'].mean()
             
-            if not df_raw_prev.empty:
-                daily_rev_prev = df_raw_prev.groupby(['Date_Only', 'Day_Type'])['total_amount'].sum().reset_index()
-                prev_type_avg = daily_rev_prev.groupby('Day_Type')['total_amount'].mean()
+            if not daily_rev_prev.empty:
+                prev_type_avg = daily_rev_prev.groupby('Day_Type', sort=False)['total_amount'].mean()
             else:
                 prev_type_avg = pd.Series()
 
@@ -119,15 +123,14 @@ def render_operational_view():
     with c_chart1:
         # Reconstruct Period breakdown from df_agg cols
         # df_agg has : lunch_revenue, dinner_revenue, date
-        period_data = []
-        for _, row in df_agg.iterrows():
-            d = row['date']
-            period_data.append({'Date_Parsed': d, 'Period': '中午 (Lunch)', 'total_amount': row['lunch_revenue'], 'plot_amount': -row['lunch_revenue']})
-            period_data.append({'Date_Parsed': d, 'Period': '晚上 (Dinner)', 'total_amount': row['dinner_revenue'], 'plot_amount': row['dinner_revenue']})
-            
-        daily_period = pd.DataFrame(period_data)
+        # Dinner block first so it is drawn above the lunch bars
+        daily_period = df_agg.melt(
+            id_vars='date', value_vars=['dinner_revenue', 'lunch_revenue'], var_name='Period', value_name='total_amount'
+        ).rename(columns={'date': 'Date_Parsed'})
+        is_lunch = daily_period['Period'] == 'lunch_revenue'
+        daily_period['Period'] = np.where(is_lunch, '中午 (Lunch)', '晚上 (Dinner)')
+        daily_period['plot_amount'] = daily_period['total_amount'].where(~is_lunch, -daily_period['total_amount'])
         daily_period['Date_Parsed'] = pd.to_datetime(daily_period['Date_Parsed'])
-        daily_period = daily_period.sort_values('Period', ascending=False)
         
         fig_bar = px.bar(
             daily_period, 
@@ -155,8 +158,6 @@ def render_operational_view():
             st.plotly_chart(fig_pie, use_container_width=True)
 
     # Line Chart Visitors Dual Axis
-    import plotly.graph_objects as go
-    from plotly.subplots import make_subplots
     
     df_agg['avg_check'] = df_agg['total_revenue'] / df_agg['total_guests'].replace(0, 1)
     
@@ -178,7 +179,7 @@ def render_operational_view():
     st.subheader("📋 詳細營運數據 (Daily Metrics Table)")
     
     df_agg['Date_Parsed'] = pd.to_datetime(df_agg['date'])
-    grouped = df_agg.set_index('Date_Parsed').resample(ov_freq)
+    grouped = df_agg.groupby(pd.Grouper(key='Date_Parsed', freq=ov_freq))
     
     base_agg = grouped.agg({
         'total_revenue': 'sum',
@@ -7,14 +7,7 @@ from datetime import date
 from dateutil.relativedelta import relativedelta
 import holidays
 import db_queries
-
-def is_holiday_tw(dt, tw_holidays):
-    """Returns True if the date is a weekend or a Taiwanese national holiday."""
-    if dt.weekday() >= 5:
-        return True
-    if dt in tw_holidays:
-        return True
-    return False
+from .utils import render_date_filter
 
 def is_cny_closed_day(dt, tw_holidays):
     """Returns True if the date is Chinese New Year's Eve through Day 3."""
@@ -32,6 +25,31 @@ def is_cny_closed_day(dt, tw_holidays):
     ]
     return any(keyword in name for keyword in cny_keywords)
 
+@st.cache_data(ttl=3600, show_spinner=False)
+def forecast_day_counts(max_date, this_month_start, years):
+    """Open weekday / holiday counts per month offset (0 = this month) for the 13 forecast columns.
+
+    Covers the rest of this month after max_date, then 12 full months. Cached because building the
+    holiday calendar dominates and only changes with the data's last day or the calendar month.
+    """
+    # All projected days at once; each day is bucketed by month offset and counted with bincount.
+    next_month_start = this_month_start + relativedelta(months=1)
+    horizon_end = this_month_start + relativedelta(months=13) - pd.Timedelta(days=1)
+    dates_proj = pd.date_range(max_date + pd.Timedelta(days=1), next_month_start - pd.Timedelta(days=1)).append(
+        pd.date_range(next_month_start, horizon_end)
+    )
+    month_idx = np.maximum((dates_proj.year - this_month_start.year) * 12 + dates_proj.month - this_month_start.month, 0)
+    
+    tw_holidays_obj = holidays.country_holidays('TW', years=sorted(set(years) | set(dates_proj.year)))
+    holiday_dates = list(tw_holidays_obj)
+    cny_closed = pd.DatetimeIndex([d for d in holiday_dates if is_cny_closed_day(d, tw_holidays_obj)])
+    is_hol = (dates_proj.dayofweek >= 5) | dates_proj.isin(pd.DatetimeIndex(holiday_dates))
+    is_open = ~dates_proj.isin(cny_closed)
+    
+    wd = np.bincount(month_idx[is_open & ~is_hol], minlength=13)
+    hd = np.bincount(month_idx[is_open & is_hol], minlength=13)
+    return wd, hd
+
 def render_prediction_view():
     st.title("📈 營業額預測 (Revenue Prediction)")
 
@@ -42,8 +60,10 @@ def render_prediction_view():
         return
 
     # Prepare Data
-    daily_rev = df_agg[['date', 'total_revenue']].rename(columns={'date': 'Date_Parsed', 'total_revenue': 'total_amount'}).copy()
+    daily_rev = df_agg[['date', 'total_revenue']].rename(columns={'date': 'Date_Parsed', 'total_revenue': 'total_amount'})
     daily_rev['Date_Parsed'] = pd.to_datetime(daily_rev['Date_Parsed'])
+    # Ascending date order lets the date windows below be cut with searchsorted instead of full-column masks
+    daily_rev = daily_rev.sort_values('Date_Parsed', ignore_index=True)
     daily_rev['Date_Only'] = daily_rev['Date_Parsed'].dt.date
     daily_rev['total_amount'] = daily_rev['total_amount'].fillna(0)
 
@@ -54,8 +74,10 @@ def render_prediction_view():
         
     years_needed = list(range(min_date.year, max_date.year + 2))
     tw_holidays_obj = holidays.country_holidays('TW', years=years_needed)
+    # Holiday = weekend or national holiday, tested against the holiday dates as one DatetimeIndex
+    holiday_idx = pd.DatetimeIndex(list(tw_holidays_obj))
 
-    daily_rev['Is_Holiday'] = daily_rev['Date_Only'].apply(lambda d: is_holiday_tw(d, tw_holidays_obj))
+    daily_rev['Is_Holiday'] = (daily_rev['Date_Parsed'].dt.dayofweek >= 5) | daily_rev['Date_Parsed'].dt.normalize().isin(holiday_idx)
     
     # UI Controls
     c1, c2 = st.columns([1, 2])
@@ -69,13 +91,17 @@ def render_prediction_view():
             days_lookback = 30
         
     start_ref_date = max_date - pd.Timedelta(days=days_lookback - 1)
-    ref_df = daily_rev[(daily_rev['Date_Only'] >= start_ref_date) & (daily_rev['Date_Only'] <= max_date)]
+    ref_df = daily_rev.iloc[daily_rev['Date_Parsed'].searchsorted(pd.Timestamp(start_ref_date)):]
     
-    past_wd = ref_df[(~ref_df['Is_Holiday']) & (ref_df['total_amount'] > 0)]
-    past_hol = ref_df[(ref_df['Is_Holiday']) & (ref_df['total_amount'] > 0)]
+    # Tabulate trading days (revenue > 0) by day type: bin 0 = weekday, bin 1 = holiday
+    amounts = ref_df['total_amount'].to_numpy(dtype=float)
+    trading = amounts > 0
+    day_type = ref_df['Is_Holiday'].to_numpy(dtype=np.intp)[trading]
+    day_counts = np.bincount(day_type, minlength=2)
+    day_sums = np.bincount(day_type, weights=amounts[trading], minlength=2)
     
-    avg_wd_rev = past_wd['total_amount'].mean() if len(past_wd) > 0 else 0
-    avg_hol_rev = past_hol['total_amount'].mean() if len(past_hol) > 0 else 0
+    avg_wd_rev = day_sums[0] / day_counts[0] if day_counts[0] > 0 else 0
+    avg_hol_rev = day_sums[1] / day_counts[1] if day_counts[1] > 0 else 0
     
     st.divider()
     col_w, col_h = st.columns(2)
@@ -89,21 +115,22 @@ def render_prediction_view():
     # Historical Trend
     st.subheader("📊 歷史平均營業額走勢 (Historical Averages Trend)")
     
-    from .utils import render_date_filter
     s_date, e_date = render_date_filter("pred_hist")
     
-    full_date_range = pd.date_range(start=min_date, end=max_date).date
-    dense_df = pd.DataFrame({'Date_Only': full_date_range})
+    full_date_range = pd.date_range(start=min_date, end=max_date)
+    dense_df = pd.DataFrame({'Date_Only': full_date_range.date})
     dense_df = dense_df.merge(daily_rev, on='Date_Only', how='left')
-    dense_df['Is_Holiday'] = dense_df['Date_Only'].apply(lambda d: is_holiday_tw(d, tw_holidays_obj))
+    dense_df['Is_Holiday'] = (full_date_range.dayofweek >= 5) | full_date_range.isin(holiday_idx)
     dense_df['total_amount'] = dense_df['total_amount'].fillna(0)
     dense_df['valid_wd_rev'] = dense_df['total_amount'].where((~dense_df['Is_Holiday']) & (dense_df['total_amount'] > 0), np.nan)
     dense_df['valid_hol_rev'] = dense_df['total_amount'].where((dense_df['Is_Holiday']) & (dense_df['total_amount'] > 0), np.nan)
     dense_df['平日平均 (Weekday Avg)'] = dense_df['valid_wd_rev'].rolling(window=days_lookback, min_periods=1).mean()
     dense_df['假日平均 (Holiday Avg)'] = dense_df['valid_hol_rev'].rolling(window=days_lookback, min_periods=1).mean()
     
-    mask = (dense_df['Date_Only'] >= s_date.date()) & (dense_df['Date_Only'] <= e_date.date())
-    chart_df = dense_df[mask].copy()
+    # dense_df rows line up with full_date_range, so the chart window is a positional slice
+    i0 = full_date_range.searchsorted(s_date.normalize())
+    i1 = full_date_range.searchsorted(e_date.normalize(), side='right')
+    chart_df = dense_df.iloc[i0:i1]
     
     if not chart_df.empty:
         melted = chart_df.melt(id_vars=['Date_Only'], value_vars=['平日平均 (Weekday Avg)', '假日平均 (Holiday Avg)'], 
@@ -128,52 +155,27 @@ def render_prediction_view():
     this_month_start = today.replace(day=1)
     
     # Actual revenue already in DB for current month (max_date may be in previous month = 0)
-    actual_this_month = float(daily_rev[
-        (daily_rev['Date_Only'] >= this_month_start) &
-        (daily_rev['Date_Only'] <= max_date)
-    ]['total_amount'].sum())
-    
-    rows = []
-    
-    for i in range(13):
-        target_start = this_month_start + relativedelta(months=i)
-        y = target_start.year
-        m = target_start.month
-        is_curr = (i == 0)
-        
-        if y not in tw_holidays_obj.years:
-            tw_holidays_obj.update(holidays.country_holidays('TW', years=y))
-            
-        month_end = target_start + relativedelta(months=1) - pd.Timedelta(days=1)
-        
-        if is_curr:
-            # Project only remaining days (after max_date in DB)
-            proj_start = max_date + pd.Timedelta(days=1)
-            p_start_date = pd.to_datetime(proj_start).date()
-            m_end_date = pd.to_datetime(month_end).date()
-            dates_proj = pd.date_range(proj_start, month_end).date if p_start_date <= m_end_date else []
-            label = target_start.strftime('%Y-%m') + ' ✨'
-        else:
-            dates_proj = pd.date_range(target_start, month_end).date
-            label = target_start.strftime('%Y-%m')
-        
-        wd = sum(1 for d in dates_proj if not is_cny_closed_day(d, tw_holidays_obj) and not is_holiday_tw(d, tw_holidays_obj))
-        hd = sum(1 for d in dates_proj if not is_cny_closed_day(d, tw_holidays_obj) and is_holiday_tw(d, tw_holidays_obj))
-        
-        forecast = (wd * avg_wd_rev) + (hd * avg_hol_rev)
-        actual = actual_this_month if is_curr else 0.0
-        
-        rows.append({
-            '月份': label,
-            '已發生營收': actual,
-            '預測剩餘': forecast,
-            '合計': actual + forecast,
-            '平日天數': wd,
-            '假日天數': hd,
-            'is_curr': is_curr,
-        })
-        
-    df_fc = pd.DataFrame(rows)
+    actual_this_month = float(
+        daily_rev['total_amount'].iloc[daily_rev['Date_Parsed'].searchsorted(pd.Timestamp(this_month_start)):].sum()
+    )
+    
+    wd, hd = forecast_day_counts(max_date, this_month_start, tuple(years_needed))
+    forecast = (wd * avg_wd_rev) + (hd * avg_hol_rev)
+    is_curr = np.arange(13) == 0
+    actual = np.where(is_curr, actual_this_month, 0.0)
+    
+    labels = pd.date_range(this_month_start, periods=13, freq='MS').strftime('%Y-%m').tolist()
+    labels[0] += ' ✨'
+    
+    df_fc = pd.DataFrame({
+        '月份': labels,
+        '已發生營收': actual,
+        '預測剩餘': forecast,
+        '合計': actual + forecast,
+        '平日天數': wd,
+        '假日天數': hd,
+        'is_curr': is_curr,
+    })
     
     # Build chart
     curr = df_fc[df_fc['is_curr']].iloc[0]
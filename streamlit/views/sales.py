@@ -4,6 +4,86 @@ import pandas as pd
 import numpy as np
 import db_queries
 
+def resample_qty(df, keys, freq):
+    """Sums qty per key combination and period with a single resample over a wide frame.
+
+    Each combination keeps only the periods between its own first and last sale, as
+    `groupby(keys).resample(freq)` would, in the same key-major row order.
+    """
+    wide = df.pivot_table(index='Date_Parsed', columns=keys, values='qty', aggfunc='sum', observed=True)
+    wide = wide.resample(freq).sum(min_count=1)
+    seen = wide.notna()
+    wide = wide.fillna(0).where(seen.cummax() & seen[::-1].cummax()[::-1])
+    return wide.unstack().dropna().astype(df['qty'].dtype).rename('qty').reset_index()
+
+def prepare_items(df_details):
+    """Main (non-modifier) item rows, ready for grouping."""
+    # Low-cardinality labels become categoricals so the groupby/resample/pivot below hash integer codes;
+    # quantities are small whole numbers, exact in float32 at half the bytes per row
+    label_cols = [c for c in ['category', 'sku', 'item_name'] if c in df_details.columns]
+    df = df_details.astype({**{c: 'category' for c in label_cols}, 'qty': 'float32'})
+
+    # Filter out modifiers for "Item Counts"
+    if 'Is_Modifier' in df.columns:
+        return df[~df['Is_Modifier']]
+    return df
+
+def filter_items(df_real, selected_cats, selected_items):
+    if selected_cats:
+        df_real = df_real[df_real['category'].isin(selected_cats)]
+    if selected_items:
+        df_real = df_real[df_real['item_name'].isin(selected_items)]
+    return df_real
+
+@st.cache_data(ttl=300, show_spinner=False)
+def build_sales_tables(start_date, end_date, freq, selected_cats, selected_items):
+    """Trend lines and sales matrix for one date range, frequency and item selection.
+
+    Returns (trend_df, sales_matrix, date_cols). Keyed on those plain arguments rather than the
+    details frame, so flipping back to an earlier grouping or selection skips the resamples and pivots.
+    """
+    # .cached: a failed query raises out of this function too, so no empty result gets cached here
+    df_real = filter_items(prepare_items(db_queries.fetch_sales_details.cached(start_date, end_date)), selected_cats, selected_items)
+
+    # Resample by date & item_name
+    df_real['Date_Parsed'] = pd.to_datetime(df_real['Date_Parsed'])
+    trend_df = resample_qty(df_real, ['item_name'], freq)
+
+    # Resample everything strictly to frequency to create columns
+    # Include 'category' and 'sku' in the grouping to keep it after resampling
+    df_pivot_prep = resample_qty(df_real, ['category', 'sku', 'item_name'], freq)
+
+    # Every period repeats once per item, so format each distinct period once and broadcast by code
+    period_codes, periods = pd.factorize(df_pivot_prep['Date_Parsed'])
+    df_pivot_prep['PeriodLabel'] = periods.strftime('%m-%d')[period_codes]
+
+    pivot_table = pd.pivot_table(df_pivot_prep, values='qty', index=['category', 'sku', 'item_name'], columns='PeriodLabel', fill_value=0, observed=True)
+
+    # Add Total Column
+    pivot_table['Total'] = pivot_table.sum(axis=1)
+
+    # Sort first by SKU (alphanumeric ascending), then by Total descending if SKUs duplicate
+    pivot_table = pivot_table.sort_values(by=['sku', 'Total'], ascending=[True, False]).reset_index()
+    pivot_table = pivot_table.set_index('item_name') # Remove default range index
+
+    # Fix unit_price KeyError by recalculating from totals
+    info = df_real.groupby('item_name', observed=True, sort=False).agg(
+        總銷售額=('item_total', 'sum'),
+        QTY=('qty', 'sum')
+    )
+    info['平均單價'] = (info['總銷售額'] / info['QTY'].replace(0, 1)).round(0)
+    info = info.drop(columns=['QTY'])
+
+    pivot_table = pivot_table.join(info)
+
+    # Clean up display columns
+    pivot_table = pivot_table.rename(columns={'category': '商品類別', 'sku': 'SKU'})
+
+    # Reorder columns slightly to put Category, SKU, Info at front, then date columns, then Total
+    date_cols = [c for c in pivot_table.columns if c not in ['Total', '總銷售額', '平均單價', '商品類別', 'SKU']]
+    final_cols = ['商品類別', 'SKU', '平均單價', '總銷售額'] + date_cols + ['Total']
+    return trend_df, pivot_table[final_cols], date_cols
+
 def render_sales_view(start_date, end_date):
     st.title("🍟 商品銷售分析 (Product Sales)")
 
@@ -14,22 +94,12 @@ def render_sales_view(start_date, end_date):
         return
 
     # 1. Filter Data
-    df = df_details.copy()
-    
-    # Filter out modifiers for "Item Counts"
-
-    if 'Is_Modifier' in df.columns:
-        df_real = df[~df['Is_Modifier']].copy()
-    else:
-        df_real = df.copy()
+    df_real = prepare_items(df_details)
 
     if df_real.empty:
         st.warning(f"此區間無主商品銷售資料 (只有配料/備註)")
         return
 
-    # Base date column for grouping
-    df_real['Date_Only'] = df_real['Date_Parsed'].dt.date
-
     # 2. Controls
     c1, c2 = st.columns([1, 2])
     with c1:
@@ -53,10 +123,7 @@ def render_sales_view(start_date, end_date):
         selected_items = st.multiselect("特定商品篩選 (留空顯示該類別全部)", options=available_items)
 
     # Filter by category and items
-    if selected_cats:
-        df_real = df_real[df_real['category'].isin(selected_cats)]
-    if selected_items:
-        df_real = df_real[df_real['item_name'].isin(selected_items)]
+    df_real = filter_items(df_real, selected_cats, selected_items)
 
     if df_real.empty:
         st.warning("篩選後無銷售資料")
@@ -77,9 +144,13 @@ def render_sales_view(start_date, end_date):
     # 4. Time Series Trend
     st.subheader(f"📈 歷史走勢 ({grouping})")
     
-    # Resample by date & item_name
-    df_real['Date_Parsed'] = pd.to_datetime(df_real['Date_Parsed'])
-    trend_df = df_real.set_index('Date_Parsed').groupby('item_name').resample(freq)['qty'].sum().reset_index()
+    try:
+        trend_df, sales_matrix, date_cols = build_sales_tables(
+            start_date, end_date, freq, tuple(selected_cats), tuple(selected_items)
+        )
+    except Exception as e:
+        st.error(f"Database query failed: {e}")
+        return
 
     fig_line = px.line(trend_df, x='Date_Parsed', y='qty', color='item_name', markers=True, title="商品銷售趨勢")
     st.plotly_chart(fig_line, use_container_width=True)
@@ -89,47 +160,12 @@ def render_sales_view(start_date, end_date):
     # 5. Detailed Data Pivot Table
     st.subheader("📋 期間商品銷售矩陣 (Sales Matrix)")
     
-    # Resample everything strictly to frequency to create columns
-    # Include 'category' and 'sku' in the grouping to keep it after resampling
-    df_pivot_prep = df_real.set_index('Date_Parsed').groupby(['category', 'sku', 'item_name']).resample(freq)['qty'].sum().reset_index()
-    
-    if freq == 'D':
-        df_pivot_prep['PeriodLabel'] = df_pivot_prep['Date_Parsed'].dt.strftime('%m-%d')
-    else:
-        df_pivot_prep['PeriodLabel'] = df_pivot_prep['Date_Parsed'].dt.strftime('%m-%d')
-        
-    pivot_table = pd.pivot_table(df_pivot_prep, values='qty', index=['category', 'sku', 'item_name'], columns='PeriodLabel', fill_value=0)
-    
-    # Add Total Column
-    pivot_table['Total'] = pivot_table.sum(axis=1)
-    
-    # Sort first by SKU (alphanumeric ascending), then by Total descending if SKUs duplicate
-    pivot_table = pivot_table.sort_values(by=['sku', 'Total'], ascending=[True, False]).reset_index()
-    pivot_table = pivot_table.set_index('item_name') # Remove default range index
-    
-    # Fix unit_price KeyError by recalculating from totals
-    info = df_real.groupby('item_name').agg(
-        總銷售額=('item_total', 'sum'),
-        QTY=('qty', 'sum')
-    )
-    info['平均單價'] = (info['總銷售額'] / info['QTY'].replace(0, 1)).round(0)
-    info = info.drop(columns=['QTY'])
-    
-    pivot_table = pivot_table.join(info)
-
-    # Clean up display columns
-    pivot_table = pivot_table.rename(columns={'category': '商品類別', 'sku': 'SKU'})
-
-    # Reorder columns slightly to put Category, SKU, Info at front, then date columns, then Total
-    date_cols = [c for c in pivot_table.columns if c not in ['Total', '總銷售額', '平均單價', '商品類別', 'SKU']]
-    final_cols = ['商品類別', 'SKU', '平均單價', '總銷售額'] + date_cols + ['Total']
-
     # Set up column formatting mapping
     format_mapping = {'平均單價': '${:,.0f}', '總銷售額': '${:,.0f}'}
     for c in date_cols + ['Total']:
         format_mapping[c] = '{:,.0f}'
 
     st.dataframe(
-        pivot_table[final_cols].style.format(format_mapping),
+        sales_matrix.style.format(format_mapping),
         use_container_width=True
     )
@@ -1,6 +1,89 @@
+import os
+from dateutil.tz import tzlocal
 import streamlit as st
 import pandas as pd
+import numpy as np
 import db_queries
+from config import DATA_DIRS
+
+# Rows shown in the file table; the full listing still feeds the file inspector
+MAX_TABLE_ROWS = 2000
+
+def iter_data_files(path):
+    """Yields DirEntry objects for spreadsheet/CSV files under path, in os.walk's top-down order.
+
+    Reuses each scandir entry (its file type comes from the directory listing) instead of
+    re-joining and re-checking paths; unreadable directories are skipped like os.walk does.
+    """
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError:
+        return
+    subdirs = []
+    for entry in entries:
+        if entry.is_dir():
+            if not entry.is_symlink():
+                subdirs.append(entry.path)
+        elif entry.name.lower().endswith(('.csv', '.xls', '.xlsx')):
+            yield entry
+    for subdir in subdirs:
+        yield from iter_data_files(subdir)
+
+@st.cache_data(ttl=10, show_spinner=False)
+def scan_data_dirs(data_dirs):
+    """Lists data files under each directory; cached briefly so widget reruns don't rescan the disk.
+
+    Returns (dir_status, df_files) where dir_status holds (path, exists, error message) per directory.
+    """
+    dir_status = []
+    # One list per column, handed to pandas as-is (no per-row dicts to transpose)
+    paths, names, sizes, mod_times = [], [], [], []
+    for d in data_dirs:
+        if not os.path.exists(d):
+            dir_status.append((d, False, None))
+            continue
+        error = None
+        try:
+            for entry in iter_data_files(d):
+                stat = entry.stat()
+                paths.append(entry.path)
+                names.append(entry.name)
+                sizes.append(stat.st_size)
+                mod_times.append(stat.st_mtime)
+        except Exception as e:
+            error = str(e)
+        dir_status.append((d, True, error))
+    # Sizes stay numeric (converted in one pass); the table formats them to two decimals
+    size_mb = np.asarray(sizes, dtype=np.float64) / (1024 * 1024)
+    # Epoch mtimes are formatted in local time in one vectorized pass
+    modified = pd.to_datetime(mod_times, unit='s', utc=True).tz_convert(tzlocal()).strftime('%Y-%m-%d %H:%M:%S')
+    df_files = pd.DataFrame({
+        "Path": pd.array(paths, dtype="string[pyarrow]"),
+        "File": pd.array(names, dtype="string[pyarrow]"),
+        "Size (MB)": size_mb,
+        "Modified": pd.array(modified, dtype="string[pyarrow]"),
+    })
+    return dir_status, df_files
+
+@st.fragment
+def render_file_inspector(file_paths):
+    """File picker + preview; runs as a fragment so picking a file doesn't rerun the whole page."""
+    st.subheader("6. 檔案內容檢查 (File Inspector)")
+    selected_file = st.selectbox("選擇檔案進行檢查 (Select File to Inspect)", file_paths)
+    
+    if selected_file:
+        if st.button(f"讀取 {os.path.basename(selected_file)} 前 5 行"):
+            try:
+                if selected_file.endswith('.csv'):
+                    # Try reading raw first to show columns
+                    df_preview = pd.read_csv(selected_file, nrows=5)
+                    st.write("Columns:", df_preview.columns.tolist())
+                    st.dataframe(df_preview)
+                else:
+                    st.info("Excel file preview not fully supported in this quick view yet.")
+            except Exception as e:
+                st.error(f"Error reading file: {e}")
 
 def render_system_check(health_logs):
     st.title("🔧 系統檢查 (System Diagnostics)")
@@ -17,53 +100,25 @@ def render_system_check(health_logs):
     st.divider()
     st.subheader("5. 伺服器檔案列表 (Server File System)")
     
-    import os
-    import time
-    from config import DATA_DIRS
-    
     # Scan all configured paths
-    found_files = []
-    for d in DATA_DIRS:
-        if os.path.exists(d):
+    dir_status, df_files = scan_data_dirs(tuple(DATA_DIRS))
+    for d, exists, error in dir_status:
+        if exists:
             st.write(f"📁 Directory found: `{d}`")
-            try:
-                for root, dirs, files in os.walk(d):
-                    for file in files:
-                        if file.lower().endswith(('.csv', '.xls', '.xlsx')):
-                            full_path = os.path.join(root, file)
-                            stat = os.stat(full_path)
-                            size_mb = stat.st_size / (1024 * 1024)
-                            mod_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stat.st_mtime))
-                            found_files.append({
-                                "Path": full_path,
-                                "File": file,
-                                "Size (MB)": f"{size_mb:.2f}",
-                                "Modified": mod_time
-                            })
-            except Exception as e:
-                st.error(f"Error scanning {d}: {e}")
+            if error:
+                st.error(f"Error scanning {d}: {error}")
         else:
             st.warning(f"❌ Directory not found: `{d}`")
             
-    if found_files:
-        df_files = pd.DataFrame(found_files)
-        st.dataframe(df_files, use_container_width=True)
-        
-        # File Inspector
-        st.subheader("6. 檔案內容檢查 (File Inspector)")
-        selected_file = st.selectbox("選擇檔案進行檢查 (Select File to Inspect)", df_files['Path'].unique())
+    if not df_files.empty:
+        st.dataframe(
+            df_files.head(MAX_TABLE_ROWS),
+            column_config={"Size (MB)": st.column_config.NumberColumn(format="%.2f")},
+            use_container_width=True
+        )
+        if len(df_files) > MAX_TABLE_ROWS:
+            st.caption(f"顯示前 {MAX_TABLE_ROWS:,} 筆，共 {len(df_files):,} 個檔案 (Showing first {MAX_TABLE_ROWS:,} of {len(df_files):,} files)")
         
-        if selected_file:
-            if st.button(f"讀取 {os.path.basename(selected_file)} 前 5 行"):
-                try:
-                    if selected_file.endswith('.csv'):
-                        # Try reading raw first to show columns
-                        df_preview = pd.read_csv(selected_file, nrows=5)
-                        st.write("Columns:", df_preview.columns.tolist())
-                        st.dataframe(df_preview)
-                    else:
-                        st.info("Excel file preview not fully supported in this quick view yet.")
-                except Exception as e:
-                    st.error(f"Error reading file: {e}")
+        render_file_inspector(df_files['Path'].unique())
     else:
         st.warning("No data files found in scan paths.")